@@ -0,0 +1,86 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from legacy import LegacyBuilding, LegacyPerson
+from population import Population
+from streams import CITY_STREAM, SPAWN_STREAM, RandomStreams
+from world import MAP_SIZES, MAX_FLAT_AREA, BuildingIndex, create_city_layout
+
+# Per-tick cost of Population.move on every map size: the original
+# per-object loop, a vectorized scan over every building, and the
+# occupancy raster lookup.
+
+
+class ScanIndex(BuildingIndex):
+    # Same interface as BuildingIndex, but tests every building in turn
+    def lookup(self, x, y):
+        ids = np.full(len(x), -1, dtype=np.int32)
+        for i in range(len(self.buildings)):
+            inside = (x >= self.left[i]) & (x < self.right[i]) & (y >= self.top[i]) & (y < self.bottom[i])
+            ids[inside] = i
+        return ids
+
+
+def setup(map_size, count, seed):
+    streams = RandomStreams(seed)
+    map_width, map_height = MAP_SIZES[map_size]
+    buildings = create_city_layout(map_width, map_height, streams.generator(CITY_STREAM))
+    population = Population.spawn(count, 0, (0, map_width), (0, map_height), 2, streams.generator(SPAWN_STREAM))
+    return streams, buildings, population, map_width, map_height
+
+
+def run_old(map_size, count, ticks, seed):
+    _, buildings, population, map_width, map_height = setup(map_size, count, seed)
+    random.seed(seed)
+    legacy_buildings = [LegacyBuilding(b) for b in buildings]
+    people = [LegacyPerson(x, y) for x, y in zip(population.x, population.y)]
+    start = time.perf_counter()
+    for _ in range(ticks):
+        for person in people:
+            person.move(legacy_buildings, map_width, map_height)
+    return (time.perf_counter() - start) / ticks
+
+
+def run_new(index_class, map_size, count, ticks, seed):
+    streams, buildings, population, map_width, map_height = setup(map_size, count, seed)
+    city = index_class(buildings, map_width, map_height)
+    start = time.perf_counter()
+    for _ in range(ticks):
+        population.move(city, map_width, map_height, streams)
+    return (time.perf_counter() - start) / ticks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Building collision benchmark")
+    parser.add_argument("--agents", type=int, default=10000)
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--max-old", type=int, default=10000,
+                        help="skip the per-object path above this population")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'map':>7} {'buildings':>9} {'objects ms':>11} {'scan ms':>8} {'index ms':>9} {'vs scan':>8}")
+    for map_size, (map_width, map_height) in MAP_SIZES.items():
+        # Bigger maps are generated in chunks, without a building list
+        if map_width * map_height > MAX_FLAT_AREA:
+            continue
+        buildings = setup(map_size, 0, args.seed)[1]
+        scan = run_new(ScanIndex, map_size, args.agents, args.ticks, args.seed)
+        index = run_new(BuildingIndex, map_size, args.agents, args.ticks, args.seed)
+        if args.agents <= args.max_old:
+            old = f"{run_old(map_size, args.agents, max(1, args.ticks // 10), args.seed) * 1000:>11.2f}"
+        else:
+            old = f"{'skipped':>11}"
+        print(f"{map_size:>7} {len(buildings):>9} {old} {scan * 1000:>8.2f} {index * 1000:>9.2f} "
+              f"{scan / index:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
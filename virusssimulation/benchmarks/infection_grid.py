@@ -0,0 +1,76 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from legacy import LegacyPerson
+from population import Population
+from streams import SPAWN_STREAM, RandomStreams
+from world import MAP_SIZES, BuildingIndex
+
+# Ticks/sec of the infection pass on the Large map: the original per-object
+# brute force over the whole population vs. the vectorized grid lookup.
+
+DT = 1 / 60
+
+
+def run_old(count, ticks, infected_fraction, radius, seed):
+    random.seed(seed)
+    map_width, map_height = MAP_SIZES["Large"]
+    people = []
+    for i in range(count):
+        person = LegacyPerson(random.uniform(0, map_width), random.uniform(0, map_height))
+        person.infection_radius = radius
+        # Nobody resolves during the run so each tick does the same work
+        person.recovery_time = 1e9
+        if i < count * infected_fraction:
+            person.status = "infected"
+        people.append(person)
+    start = time.perf_counter()
+    for _ in range(ticks):
+        for person in people:
+            person.update(DT, people, [])
+    return ticks / (time.perf_counter() - start)
+
+
+def run_new(count, ticks, infected_fraction, radius, seed):
+    streams = RandomStreams(seed)
+    map_width, map_height = MAP_SIZES["Large"]
+    population = Population.spawn(
+        count, int(count * infected_fraction), (0, map_width), (0, map_height), 2,
+        streams.generator(SPAWN_STREAM),
+        infection_radius=radius, recovery_time=1e9
+    )
+    city = BuildingIndex([], map_width, map_height)
+    start = time.perf_counter()
+    for _ in range(ticks):
+        population.update(DT, city, map_width, map_height, streams)
+    return ticks / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Infection check benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--ticks", type=int, default=5)
+    parser.add_argument("--infected", type=float, default=0.1, help="infected fraction")
+    parser.add_argument("--radius", type=float, default=10)
+    parser.add_argument("--max-old", type=int, default=10000,
+                        help="skip the per-object path above this population")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'agents':>8} {'old ticks/s':>12} {'new ticks/s':>12} {'speedup':>8}")
+    for count in args.sizes:
+        new = run_new(count, args.ticks, args.infected, args.radius, args.seed)
+        if count <= args.max_old:
+            old = run_old(count, args.ticks, args.infected, args.radius, args.seed)
+            print(f"{count:>8} {old:>12.2f} {new:>12.2f} {new / old:>7.1f}x")
+        else:
+            print(f"{count:>8} {'skipped':>12} {new:>12.2f} {'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import math
+import random
+
+import pygame
+
+# The original one-object-per-agent model, kept as the "before" side of the
+# benchmarks. Buildings only need a pygame-style `rect` and a `type`.
+
+
+class LegacyPerson:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+        self.vx = random.uniform(-2, 2)
+        self.vy = random.uniform(-2, 2)
+        self.status = "healthy"
+        self.infection_time = 0
+        self.size = 5
+        self.recovery_time = 10
+        self.death_chance = 0.2
+        self.recovery_chance = 0.8
+        self.infection_radius = 10
+        self.target = None
+        self.target_type = None
+
+    def move(self, buildings, map_width, map_height):
+        if self.status != "dead":
+            if self.target:
+                dx = self.target[0] - self.x
+                dy = self.target[1] - self.y
+                dist = math.sqrt(dx*dx + dy*dy)
+                if dist > 5:
+                    self.vx = dx/dist * 2
+                    self.vy = dy/dist * 2
+                else:
+                    self.target = None
+                    self.target_type = None
+            else:
+                self.vx += random.uniform(-0.2, 0.2)
+                self.vy += random.uniform(-0.2, 0.2)
+                speed = math.sqrt(self.vx*self.vx + self.vy*self.vy)
+                if speed > 2:
+                    self.vx = self.vx/speed * 2
+                    self.vy = self.vy/speed * 2
+
+            self.x += self.vx
+            self.y += self.vy
+
+            # Keep within map bounds
+            self.x = max(0, min(map_width, self.x))
+            self.y = max(0, min(map_height, self.y))
+
+            # Avoid buildings
+            for building in buildings:
+                if building.rect.collidepoint(self.x, self.y):
+                    if self.x < building.rect.left:
+                        self.x = building.rect.left - 1
+                    elif self.x > building.rect.right:
+                        self.x = building.rect.right + 1
+                    if self.y < building.rect.top:
+                        self.y = building.rect.top - 1
+                    elif self.y > building.rect.bottom:
+                        self.y = building.rect.bottom + 1
+
+    def update(self, dt, people, buildings):
+        if self.status == "infected":
+            self.infection_time += dt
+
+            # Infected people try to go to hospital
+            if not self.target and random.random() < 0.01:
+                for building in buildings:
+                    if building.type == 'hospital':
+                        self.target = (building.rect.centerx, building.rect.centery)
+                        self.target_type = 'hospital'
+                        break
+
+            if self.infection_time >= self.recovery_time:
+                if random.random() < self.death_chance:
+                    self.status = "dead"
+                else:
+                    if random.random() < self.recovery_chance:
+                        self.status = "recovered"
+                    else:
+                        self.status = "healthy"
+                    self.infection_time = 0
+
+            # Try to infect others
+            for person in people:
+                if person.status == "healthy":
+                    distance = math.sqrt((self.x - person.x)**2 + (self.y - person.y)**2)
+                    if distance < self.infection_radius and random.random() < 0.4:
+                        person.status = "infected"
+
+
+class LegacyBuilding:
+    def __init__(self, building):
+        self.rect = pygame.Rect(building.x, building.y, building.width, building.height)
+        self.type = building.type
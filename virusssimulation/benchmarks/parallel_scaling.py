@@ -0,0 +1,103 @@
+import argparse
+import os
+import sys
+import time
+from dataclasses import replace
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import Engine, SimulationConfig
+from parallel import ParallelEngine
+from population import STATUS_NAMES
+from world import MAP_SIZES
+
+# Ticks/sec of one large run on the serial engine vs. the tiled
+# ParallelEngine on 1 to N worker processes. With --runs, also checks that
+# both give the same epidemic: many small seeded runs of each, which should
+# match run for run, compared by mean final counts and peak infected.
+
+
+def default_workers():
+    workers = [1]
+    while workers[-1] * 2 <= (os.cpu_count() or 1):
+        workers.append(workers[-1] * 2)
+    if workers[-1] != (os.cpu_count() or 1):
+        workers.append(os.cpu_count())
+    return workers
+
+
+def ticks_per_second(engine, warmup, ticks):
+    engine.start()
+    engine.run(warmup)
+    start = time.perf_counter()
+    engine.run(ticks)
+    return ticks / (time.perf_counter() - start)
+
+
+def epidemic(engine, ticks):
+    # Final count per status and the peak number infected
+    engine.start()
+    peak = 0
+    for _ in range(ticks):
+        engine.step()
+        peak = max(peak, engine.population.status_counts[STATUS_NAMES.index("infected")])
+    return np.append(engine.population.counts(), peak)
+
+
+def compare_runs(args, workers):
+    base = SimulationConfig(population=args.runs_population, map_size=args.map_size)
+    serial = []
+    parallel = []
+    for seed in range(args.runs):
+        config = replace(base, seed=seed)
+        serial.append(epidemic(Engine(config), args.runs_ticks))
+        with ParallelEngine(config, workers) as engine:
+            parallel.append(epidemic(engine, args.runs_ticks))
+    serial = np.array(serial, dtype=float)
+    parallel = np.array(parallel, dtype=float)
+
+    print(f"\n{args.runs} runs of {args.runs_population} agents, {args.runs_ticks} ticks, "
+          f"serial vs {workers} workers")
+    print(f"{'':>10} {'serial':>16} {'parallel':>16} {'z':>6}")
+    for i, name in enumerate(STATUS_NAMES + ("peak",)):
+        # Difference of the means in standard errors
+        error = np.sqrt((serial[:, i].var(ddof=1) + parallel[:, i].var(ddof=1)) / args.runs)
+        z = (parallel[:, i].mean() - serial[:, i].mean()) / error if error > 0 else 0.0
+        print(f"{name:>10} {serial[:, i].mean():>9.1f} ±{serial[:, i].std(ddof=1):>5.1f} "
+              f"{parallel[:, i].mean():>9.1f} ±{parallel[:, i].std(ddof=1):>5.1f} {z:>6.2f}")
+    same = np.all(serial == parallel, axis=1).sum()
+    print(f"{same} of {args.runs} runs identical")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel engine scaling benchmark")
+    parser.add_argument("--population", type=int, default=1000000)
+    parser.add_argument("--map-size", choices=list(MAP_SIZES), default="Large")
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers())
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=0,
+                        help="also compare this many seeded serial and parallel runs")
+    parser.add_argument("--runs-population", type=int, default=5000)
+    parser.add_argument("--runs-ticks", type=int, default=1800)
+    args = parser.parse_args()
+
+    config = SimulationConfig(population=args.population, map_size=args.map_size, seed=args.seed)
+    print(f"{args.population} agents on the {args.map_size} map, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'ticks/s':>10} {'speedup':>8} {'efficiency':>11}")
+    serial = ticks_per_second(Engine(config), args.warmup, args.ticks)
+    print(f"{'serial':>8} {serial:>10.2f} {'1.0x':>8} {'-':>11}")
+    for workers in args.workers:
+        with ParallelEngine(config, workers) as engine:
+            rate = ticks_per_second(engine, args.warmup, args.ticks)
+        print(f"{workers:>8} {rate:>10.2f} {rate / serial:>7.1f}x {rate / serial / workers:>10.0%}")
+
+    if args.runs:
+        compare_runs(args, max(args.workers))
+
+
+if __name__ == "__main__":
+    main()
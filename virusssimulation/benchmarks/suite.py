@@ -0,0 +1,293 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from engine import Engine, SimulationConfig
+from population import Population
+from streams import SPAWN_STREAM, RandomStreams
+from world import MAP_SIZES, create_city
+
+# Reproducible timings of the model and rendering hot paths. Every scenario
+# is built from a fixed seed, so two runs of the suite do the same work and
+# their numbers can be compared:
+#
+#   python benchmarks/suite.py run --label "before"
+#   python benchmarks/suite.py run --label "after"
+#   python benchmarks/suite.py compare
+
+SEED = 1234
+DEFAULT_HISTORY = os.path.join(BENCH_DIR, "history.json")
+
+TICK_POPULATIONS = (1000, 10000, 100000)
+TICK_WARMUP = 30
+TICK_CALLS = 10  # Ticks per round; fixed, so every run steps the same states
+INFECTION_POPULATION = 20000
+INFECTED_FRACTIONS = (0.01, 0.1, 0.5, 0.9)
+COLLISION_POPULATIONS = (10000, 100000)
+RENDER_ZOOMS = (0.5, 1.0, 2.0)
+RENDER_POPULATIONS = (1000, 50000, 500000)
+
+# Each round runs an operation for at least this long; the reported time
+# is the median over the rounds
+MIN_ROUND_TIME = 0.05
+DEFAULT_ROUNDS = 5
+
+# Changes smaller than this are timer noise whatever the percentage
+NOISE_FLOOR_MS = 0.02
+
+
+def tick_benchmarks(quick):
+    # A full engine step (movement, collisions, infection) on each map,
+    # started from a seeded population a few ticks into the run
+    populations = TICK_POPULATIONS[:2] if quick else TICK_POPULATIONS
+    for map_size in MAP_SIZES:
+        for count in populations:
+            engine = Engine(SimulationConfig(population=count, map_size=map_size, seed=SEED))
+            engine.start()
+            engine.run(TICK_WARMUP)
+            yield f"tick/{map_size}/{count}", engine.step, TICK_CALLS
+
+
+def infection_benchmarks(quick):
+    # The infection pass alone against a fixed infected share. With zero
+    # infection chance nobody changes status, so every call does the same
+    # neighbour search and distance tests.
+    map_width, map_height = MAP_SIZES["Large"]
+    for fraction in INFECTED_FRACTIONS:
+        streams = RandomStreams(SEED)
+        population = Population.spawn(
+            INFECTION_POPULATION, int(INFECTION_POPULATION * fraction),
+            (0, map_width), (0, map_height), 2, streams.generator(SPAWN_STREAM), infection_chance=0
+        )
+        infected = np.flatnonzero(population.status == 1)
+        yield (f"infection/{fraction:g}",
+               lambda p=population, i=infected, s=streams: p.infect(i, map_width, map_height, s), None)
+
+
+def collision_benchmarks(quick):
+    # Building lookups and push-out for random points on each map
+    populations = COLLISION_POPULATIONS[:1] if quick else COLLISION_POPULATIONS
+    for map_size, (map_width, map_height) in MAP_SIZES.items():
+        rng = np.random.default_rng(SEED)
+        city = create_city(map_width, map_height, rng)
+        for count in populations:
+            x = rng.uniform(0, map_width, count)
+            y = rng.uniform(0, map_height, count)
+
+            def collide(city=city, x=x, y=y):
+                x = x.copy()
+                y = y.copy()
+                city.push_out(x, y, city.lookup(x, y))
+            yield f"collision/{map_size}/{count}", collide, None
+
+
+def render_benchmarks(quick):
+    # Off-screen drawing of the city and the people on the Large map at
+    # several zoom levels, with the SDL dummy video driver
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    try:
+        import pygame
+        import virus_simulator as ui
+    except ImportError as e:
+        print(f"Skipping rendering benchmarks: {e}", file=sys.stderr)
+        return
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((ui.WINDOW_WIDTH, ui.WINDOW_HEIGHT))
+    font = pygame.font.Font(None, 36)
+
+    engine = Engine(SimulationConfig(map_size="Large", seed=SEED))
+    map_width, map_height = engine.map_width, engine.map_height
+    populations = RENDER_POPULATIONS[:2] if quick else RENDER_POPULATIONS
+    for zoom in RENDER_ZOOMS:
+        camera = ui.Camera()
+        camera.zoom = zoom
+        # Look at the middle of the map
+        view_width = (ui.WINDOW_WIDTH - ui.UI_PANEL_WIDTH) / zoom
+        view_height = ui.WINDOW_HEIGHT / zoom
+        camera.x = (map_width - view_width) / 2
+        camera.y = (map_height - view_height) / 2
+
+        layer = ui.StaticWorldLayer(engine.city, map_width, map_height, font)
+        yield f"render/world_cached/{zoom:g}", lambda l=layer, c=camera: l.draw(screen, c), None
+
+        def world_uncached(layer=layer, camera=camera):
+            layer.tiles.clear()
+            layer.draw(screen, camera)
+        yield f"render/world_uncached/{zoom:g}", world_uncached, None
+
+        for count in populations:
+            rng = np.random.default_rng(SEED)
+            population = Population.spawn(count, count // 10, (0, map_width), (0, map_height), 2, rng)
+            renderer = ui.AgentRenderer()
+            yield (f"render/agents/{zoom:g}/{count}",
+                   lambda r=renderer, c=camera, p=population: r.draw(screen, c, p), None)
+
+
+GROUPS = {
+    "tick": tick_benchmarks,
+    "infection": infection_benchmarks,
+    "collision": collision_benchmarks,
+    "render": render_benchmarks,
+}
+
+
+def measure(op, rounds, number=None):
+    # Median and best milliseconds per call. Without a fixed `number` of
+    # calls per round, enough are made to get past the timer resolution;
+    # benchmarks whose state changes on every call must give one.
+    start = time.perf_counter()
+    op()
+    once = time.perf_counter() - start
+    if number is None:
+        number = max(1, int(MIN_ROUND_TIME / max(once, 1e-9)))
+    times = []
+    # Like timeit, keep the garbage collector from landing in one round
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for _ in range(number):
+                op()
+            times.append((time.perf_counter() - start) / number * 1000)
+    finally:
+        gc.enable()
+    return {"ms": float(np.median(times)), "min_ms": float(min(times)), "calls": number * rounds}
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def run(args):
+    groups = args.groups or list(GROUPS)
+    results = {}
+    for group in groups:
+        for name, op, number in GROUPS[group](args.quick):
+            if args.filter and args.filter not in name:
+                continue
+            results[name] = measure(op, args.rounds, number)
+            print(f"{name:<36}{results[name]['ms']:>10.3f} ms", flush=True)
+
+    entry = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "label": args.label,
+        "commit": git_commit(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "quick": args.quick,
+        "results": results,
+    }
+    history = load_history(args.history)
+    history.append(entry)
+    with open(args.history, "w") as f:
+        json.dump(history, f, indent=1)
+    print(f"Saved as run {len(history) - 1} in {args.history}")
+
+
+def describe(index, entry):
+    parts = [f"#{index}", entry["time"]]
+    if entry.get("commit"):
+        parts.append(entry["commit"])
+    if entry.get("label"):
+        parts.append(repr(entry["label"]))
+    return " ".join(parts)
+
+
+def compare(args):
+    # Flags every benchmark that got slower than the threshold, by default
+    # on the best round as it is the least affected by other load on the
+    # machine. Exits with status 1 when there is at least one regression.
+    key = "min_ms" if args.stat == "min" else "ms"
+    history = load_history(args.history)
+    if len(history) < 2:
+        sys.exit(f"Need at least two runs in {args.history} to compare")
+    base = history[args.base]
+    head = history[args.head]
+    print(f"base {describe(args.base % len(history), base)}")
+    print(f"head {describe(args.head % len(history), head)}")
+    print(f"{'benchmark':<36}{'base ms':>10}{'head ms':>10}{'change':>9}")
+
+    regressions = 0
+    for name, result in head["results"].items():
+        if name not in base["results"]:
+            print(f"{name:<36}{'-':>10}{result[key]:>10.3f}{'new':>9}")
+            continue
+        before = base["results"][name][key]
+        after = result[key]
+        change = after / before - 1 if before > 0 else 0
+        flag = ""
+        if abs(after - before) >= NOISE_FLOOR_MS:
+            if change > args.threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            elif change < -args.threshold:
+                flag = "  faster"
+        print(f"{name:<36}{before:>10.3f}{after:>10.3f}{change:>+9.1%}{flag}")
+
+    if regressions:
+        print(f"{regressions} regression(s) above {args.threshold:.0%}")
+        sys.exit(1)
+    print(f"No regressions above {args.threshold:.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproducible benchmark suite")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON file the runs are kept in")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="time every benchmark and append the results to the history")
+    run_parser.add_argument("groups", nargs="*", metavar="GROUP",
+                            help=f"benchmark groups to run: {', '.join(GROUPS)} (default: all)")
+    run_parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+    run_parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS)
+    run_parser.add_argument("--quick", action="store_true", help="skip the largest populations")
+    run_parser.add_argument("--label", help="note stored with the run, e.g. the change being tested")
+
+    compare_parser = commands.add_parser("compare", help="compare two runs from the history")
+    compare_parser.add_argument("--base", type=int, default=-2, help="index of the baseline run (default: second to last)")
+    compare_parser.add_argument("--head", type=int, default=-1, help="index of the run to check (default: last)")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="slowdown that counts as a regression (default: 0.1 = 10%%)")
+    compare_parser.add_argument("--stat", choices=("min", "median"), default="min",
+                                help="which time per call to compare (default: min)")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        for group in args.groups:
+            if group not in GROUPS:
+                parser.error(f"unknown benchmark group '{group}'")
+        run(args)
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import json
+import os
+from dataclasses import asdict, fields
+
+import numpy as np
+
+from engine import Engine, SimulationConfig
+from population import POPULATION_ARRAYS, Population
+from spatial_grid import SpatialGrid
+from streams import RandomStreams
+from world import BUILDING_TYPES, MAP_SIZES, Building, BuildingIndex, ChunkedCity
+
+# File layout: MAGIC, a little-endian uint32 version and header length, a
+# JSON header, then every array as raw bytes. Array offsets in the header
+# count from the first 64-byte boundary after it and are 64-byte aligned
+# too. Loading maps the file instead of parsing it.
+MAGIC = b"VSIMCKPT"
+VERSION = 3
+PREFIX_SIZE = len(MAGIC) + 8
+ALIGNMENT = 64
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _building_arrays(city):
+    # A chunked city is remade from its seed instead
+    if isinstance(city, ChunkedCity):
+        return {}
+    buildings = city.buildings
+    return {
+        "building_x": np.array([b.x for b in buildings], dtype=np.int64),
+        "building_y": np.array([b.y for b in buildings], dtype=np.int64),
+        "building_width": np.array([b.width for b in buildings], dtype=np.int64),
+        "building_height": np.array([b.height for b in buildings], dtype=np.int64),
+        "building_type": np.array([BUILDING_TYPES.index(b.type) for b in buildings], dtype=np.int8),
+    }
+
+
+def save_checkpoint(engine, path):
+    population = engine.population
+    arrays = _building_arrays(engine.city)
+    for name in POPULATION_ARRAYS:
+        arrays[name] = np.ascontiguousarray(getattr(population, name))
+
+    header = {
+        "config": asdict(engine.config),
+        "map_width": engine.map_width,
+        "map_height": engine.map_height,
+        "time": engine.time,
+        "ticks": engine.ticks,
+        "grid_cell_size": population.grid.cell_size,
+        # With the tick count, all a run's random numbers depend on
+        "seed": engine.streams.seed,
+        "city_seed": engine.city.seed if isinstance(engine.city, ChunkedCity) else None,
+        "arrays": {},
+    }
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _align(offset + array.nbytes)
+    text = json.dumps(header).encode()
+    data_start = _align(PREFIX_SIZE + len(text))
+
+    # Write next to the target and swap it in, so a crash mid-save never
+    # leaves a truncated checkpoint behind
+    temp_path = f"{path}.tmp"
+    data = np.memmap(temp_path, dtype=np.uint8, mode="w+", shape=(data_start + offset,))
+    data[:len(MAGIC)] = np.frombuffer(MAGIC, dtype=np.uint8)
+    data[len(MAGIC):PREFIX_SIZE] = np.array([VERSION, len(text)], dtype="<u4").view(np.uint8)
+    data[PREFIX_SIZE:PREFIX_SIZE + len(text)] = np.frombuffer(text, dtype=np.uint8)
+    for name, array in arrays.items():
+        start = data_start + header["arrays"][name]["offset"]
+        data[start:start + array.nbytes] = array.reshape(-1).view(np.uint8)
+    data.flush()
+    del data
+    os.replace(temp_path, path)
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        prefix = f.read(PREFIX_SIZE)
+        if len(prefix) < PREFIX_SIZE or prefix[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a simulation checkpoint")
+        version, length = np.frombuffer(prefix[len(MAGIC):], dtype="<u4")
+        if version != VERSION:
+            raise ValueError(f"{path} is checkpoint version {version}, expected {VERSION}")
+        header = json.loads(f.read(int(length)))
+    header["data_start"] = _align(PREFIX_SIZE + int(length))
+    return header
+
+
+def load_checkpoint(path):
+    # Returns a running Engine in exactly the saved state, so stepping it
+    # gives the same results as the run that wrote the checkpoint
+    header = read_header(path)
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    # Every array must lie inside the file, or a save was cut short
+    end = header["data_start"]
+    for entry in header["arrays"].values():
+        size = int(np.prod(entry["shape"])) * np.dtype(entry["dtype"]).itemsize
+        end = max(end, header["data_start"] + entry["offset"] + size)
+    if len(data) < end:
+        raise ValueError(f"{path} is truncated")
+    arrays = {}
+    for name, entry in header["arrays"].items():
+        view = np.ndarray(entry["shape"], dtype=np.dtype(entry["dtype"]), buffer=data,
+                          offset=header["data_start"] + entry["offset"])
+        # Copy out of the mapping so the file can be overwritten by the
+        # next save while this state is still in use
+        arrays[name] = np.array(view)
+    del data
+
+    known = {field.name for field in fields(SimulationConfig)}
+    config = SimulationConfig(**{k: v for k, v in header["config"].items() if k in known})
+    map_width, map_height = header["map_width"], header["map_height"]
+    if MAP_SIZES.get(config.map_size) != (map_width, map_height):
+        raise ValueError(f"{path} was saved on a {map_width}x{map_height} map, "
+                         f"but map size '{config.map_size}' is not that size")
+    if header.get("city_seed") is not None:
+        city = ChunkedCity(map_width, map_height, header["city_seed"])
+    else:
+        buildings = [
+            Building(int(x), int(y), int(width), int(height), BUILDING_TYPES[type_])
+            for x, y, width, height, type_ in zip(
+                arrays["building_x"], arrays["building_y"], arrays["building_width"],
+                arrays["building_height"], arrays["building_type"])
+        ]
+        city = BuildingIndex(buildings, map_width, map_height)
+    engine = Engine(config, city)
+
+    population = Population(len(arrays["x"]))
+    for name in POPULATION_ARRAYS:
+        setattr(population, name, arrays[name])
+    population.recount()
+    population.time = header["time"]
+    population.tick = header["ticks"]
+    population.reschedule()
+    population.grid = SpatialGrid(header["grid_cell_size"])
+    engine.population = population
+
+    engine.streams = RandomStreams(header["seed"])
+    engine.time = header["time"]
+    engine.ticks = header["ticks"]
+    engine.running = True
+    return engine
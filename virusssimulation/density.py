@@ -0,0 +1,108 @@
+import numpy as np
+
+from population import INFECTED, STATUS_NAMES
+from recorder import NpyAppender
+
+# World units per side of a cell; coarser on maps that would need more
+# than MAX_DENSITY_CELLS
+DENSITY_CELL = 100
+MAX_DENSITY_CELLS = 1 << 18
+
+# Per-cell layers: people of each status, infections that happened in the
+# cell this tick, and all infections there since the grid was reset
+DENSITY_FIELDS = STATUS_NAMES + ("new_infections", "cases")
+
+
+class DensityGrid:
+    # Counts of people per map cell, binned from the agent arrays in one
+    # bincount per tick, so the cost depends on the number of agents but
+    # not on how they are drawn. `version` goes up with every update, for
+    # views that only redraw when the data changed.
+    #
+    # With `path`, every `every`-th update is appended to an .npy file of
+    # one row per tick (tick, time, cell_size and a (rows, cols) array per
+    # field), readable with np.load while the run goes on.
+    def __init__(self, map_width, map_height, cell_size=DENSITY_CELL, path=None, every=1):
+        area = map_width * map_height
+        self.cell_size = max(cell_size, int(np.ceil(np.sqrt(area / MAX_DENSITY_CELLS))))
+        self.cols = -(-int(map_width) // self.cell_size)
+        self.rows = -(-int(map_height) // self.cell_size)
+        self.layers = np.zeros((len(DENSITY_FIELDS), self.rows, self.cols), dtype=np.int32)
+        self.tick = 0
+        self.time = 0.0
+        self.version = 0
+        self.every = max(1, every)
+        self.writer = None
+        if path:
+            dtype = np.dtype([("tick", np.int64), ("time", np.float64), ("cell_size", np.int32)] +
+                             [(name, np.int32, (self.rows, self.cols)) for name in DENSITY_FIELDS])
+            self.writer = NpyAppender(path, dtype)
+
+    def layer(self, name):
+        # (rows, cols) counts of one of DENSITY_FIELDS
+        return self.layers[DENSITY_FIELDS.index(name)]
+
+    def cells_of(self, x, y):
+        # Positions are never negative, so truncating is flooring, and much
+        # faster than floor division on floats
+        cx = np.clip((x / self.cell_size).astype(np.int64), 0, self.cols - 1)
+        cy = np.clip((y / self.cell_size).astype(np.int64), 0, self.rows - 1)
+        return cy * self.cols + cx
+
+    def reset(self):
+        self.layers[:] = 0
+        self.version += 1
+
+    def update(self, population, tick):
+        cells = self.cells_of(population.x, population.y)
+        count = self.rows * self.cols
+        status = len(STATUS_NAMES)
+        # One pass for every status: status * cells + cell
+        binned = np.bincount(population.status.astype(np.int64) * count + cells, minlength=status * count)
+        self.layers[:status] = binned.reshape(status, self.rows, self.cols)
+        # Infected this tick: their infection started at the current time
+        new = (population.status == INFECTED) & (population.infected_at == population.time)
+        incidence = np.bincount(cells[new], minlength=count).reshape(self.rows, self.cols)
+        self.layer("new_infections")[:] = incidence
+        self.layer("cases")[:] += incidence
+        self.tick = tick
+        self.time = population.time
+        self.version += 1
+        if self.writer is not None and tick % self.every == 0:
+            self.write()
+
+    def write(self):
+        row = np.zeros(1, dtype=self.writer.dtype)
+        row["tick"] = self.tick
+        row["time"] = self.time
+        row["cell_size"] = self.cell_size
+        for name, layer in zip(DENSITY_FIELDS, self.layers):
+            row[name] = layer
+        self.writer.append(row)
+
+    def total(self):
+        return self.layers[:len(STATUS_NAMES)].sum(axis=0)
+
+    def infected_share(self):
+        # Infected people over everyone alive in the cell, 0 where empty
+        alive = self.total() - self.layer("dead")
+        return self.layer("infected") / np.maximum(alive, 1)
+
+    def attack_rate(self):
+        # Share of the people in each cell who have caught the virus:
+        # infected, recovered or dead. People who got over it without
+        # immunity count as healthy again.
+        total = self.total()
+        return (total - self.layer("healthy")) / np.maximum(total, 1)
+
+    def hotspot(self):
+        # ((x, y) world centre, infected count) of the cell with the most
+        # infected people
+        infected = self.layer("infected")
+        row, col = np.unravel_index(np.argmax(infected), infected.shape)
+        centre = ((col + 0.5) * self.cell_size, (row + 0.5) * self.cell_size)
+        return centre, int(infected[row, col])
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
@@ -0,0 +1,260 @@
+import argparse
+import time
+from dataclasses import dataclass, fields, replace
+from typing import Optional
+
+from population import STATUS_NAMES, Population
+from profiling import NULL_TIMER, PhaseTimer, format_summary
+from recorder import StatsRecorder
+from streams import CITY_STREAM, SPAWN_STREAM, RandomStreams
+from world import MAP_SIZES, create_city
+
+# One simulation tick, matching the UI's 60 FPS frame
+DT = 1 / 60
+
+# Nobody spawns in the leftmost strip the UI panel covers at the start
+SPAWN_LEFT = 300
+SPAWN_MARGIN = 100
+
+# Settings that only apply when people are spawned, so a resumed run
+# can't change them
+SPAWN_SETTINGS = ("population", "initial_infected_pct", "movement_speed", "map_size")
+
+
+@dataclass
+class SimulationConfig:
+    # Same units as the UI sliders
+    population: int = 100
+    initial_infected_pct: float = 10
+    infection_radius: float = 10
+    infection_chance_pct: float = 40
+    death_chance_pct: float = 20
+    recovery_chance_pct: float = 80
+    recovery_time: float = 10
+    movement_speed: float = 2
+    map_size: str = "Small"
+    seed: Optional[int] = None
+
+
+class Engine:
+    # The model without any window or event loop: the city, the population
+    # and the clock. Steps as fast as the CPU allows.
+    def __init__(self, config, city=None):
+        self.config = config
+        self.map_width, self.map_height = MAP_SIZES[config.map_size]
+        self.streams = RandomStreams(config.seed)
+        if city is None:
+            city = create_city(self.map_width, self.map_height, self.streams.generator(CITY_STREAM))
+        self.city = city
+        self.population = Population(0)
+        self.time = 0
+        self.ticks = 0
+        self.running = False
+        # Per-phase timings of each step; a no-op unless profiling
+        self.timer = NULL_TIMER
+        # Who infected whom, when set to a transmissions.TransmissionLog
+        self.transmissions = None
+        # People per map cell, when set to a density.DensityGrid
+        self.density = None
+
+    def start(self):
+        config = self.config
+        num_people = int(config.population)
+        num_infected = int(num_people * config.initial_infected_pct / 100)
+        # Each run starts from the seed, so the same seed replays it exactly;
+        # without one, every run gets a fresh seed
+        self.streams = RandomStreams(config.seed)
+        self.population = Population.spawn(
+            num_people, num_infected,
+            (SPAWN_LEFT, self.map_width - SPAWN_MARGIN), (0, self.map_height - SPAWN_MARGIN),
+            config.movement_speed, self.streams.generator(SPAWN_STREAM),
+            infection_radius=config.infection_radius,
+            infection_chance=config.infection_chance_pct / 100,
+            death_chance=config.death_chance_pct / 100,
+            recovery_chance=config.recovery_chance_pct / 100,
+            recovery_time=config.recovery_time
+        )
+        self.time = 0
+        self.ticks = 0
+        self.running = True
+        if self.transmissions is not None:
+            self.transmissions.attach(self.population, self.ticks)
+        if self.density is not None:
+            self.density.reset()
+            self.density.update(self.population, self.ticks)
+
+    def configure(self, config):
+        # Switch to new disease parameters without restarting, e.g. on a
+        # branch resumed from a checkpoint. The population, map and
+        # movement settings only take effect at start().
+        self.config = config
+        self.population.set_parameters(
+            config.infection_radius, config.infection_chance_pct / 100,
+            config.death_chance_pct / 100, config.recovery_chance_pct / 100,
+            config.recovery_time
+        )
+
+    def step(self, dt=DT):
+        self.population.step(dt, self.city, self.map_width, self.map_height, self.streams, self.timer)
+        self.time += dt
+        self.ticks += 1
+        if self.transmissions is not None:
+            self.transmissions.record(self.ticks, self.population)
+        if self.density is not None:
+            self.density.update(self.population, self.ticks)
+
+    def run(self, ticks, dt=DT):
+        for _ in range(ticks):
+            self.step(dt)
+
+    def counts(self):
+        return dict(zip(STATUS_NAMES, self.population.counts().tolist()))
+
+    def close(self):
+        # Flushes the transmission log and density export; the parallel
+        # engine also stops its workers
+        if self.transmissions is not None:
+            self.transmissions.close()
+            self.transmissions = None
+        if self.density is not None:
+            self.density.close()
+            self.density = None
+
+
+def seed_arg(text):
+    # Seeds feed numpy's SeedSequence, which takes whole numbers from 0 up
+    value = int(text)
+    if value < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or more, not {value}")
+    return value
+
+
+def positive_int(text):
+    value = int(text)
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {value}")
+    return value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the virus simulation without a window")
+    parser.add_argument("--ticks", type=int, default=3600, help="number of 1/60 s ticks to run")
+    parser.add_argument("--scenario", metavar="PATH",
+                        help="start from the settings in this .toml or .json file; options given here override it")
+    parser.add_argument("--stats-out", help="stream per-tick status counts to this .npy file")
+    parser.add_argument("--resume", metavar="PATH",
+                        help="continue from a checkpoint; disease parameters and --seed may be overridden")
+    parser.add_argument("--checkpoint", metavar="PATH", help="save the final state to this checkpoint file")
+    parser.add_argument("--profile-out", metavar="PATH",
+                        help="write per-tick phase timings to this JSON lines file and print a summary")
+    parser.add_argument("--transmissions", metavar="PATH",
+                        help="log who infected whom to this .npy file; see transmissions.py")
+    parser.add_argument("--density-out", metavar="PATH",
+                        help="write per-cell counts of people by status to this .npy file; see density.py")
+    parser.add_argument("--density-every", type=int, default=1, metavar="TICKS",
+                        help="write the cell counts every this many ticks (default: 1)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="step the run on this many processes, one map tile each (default: 1, serial)")
+    # Config options default to unset, so a resumed run can tell which
+    # ones were given on the command line
+    for field in fields(SimulationConfig):
+        if field.name == "map_size":
+            parser.add_argument("--map-size", choices=list(MAP_SIZES), default=argparse.SUPPRESS)
+        elif field.name == "seed":
+            parser.add_argument("--seed", type=seed_arg, default=argparse.SUPPRESS)
+        else:
+            parser.add_argument("--" + field.name.replace("_", "-"), type=field.type, default=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    overrides = {field.name: getattr(args, field.name) for field in fields(SimulationConfig)
+                 if hasattr(args, field.name)}
+
+    if args.resume:
+        if args.scenario:
+            parser.error("--scenario starts a new run and can't be used with --resume")
+        # Imported here as checkpoint builds on this module
+        from checkpoint import load_checkpoint
+        fixed = [name for name in SPAWN_SETTINGS if name in overrides]
+        if fixed:
+            parser.error("a resumed run can't change " + ", ".join("--" + n.replace("_", "-") for n in fixed))
+        try:
+            engine = load_checkpoint(args.resume)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        engine.configure(replace(engine.config, **overrides))
+        if "seed" in overrides:
+            # A new seed forks the run onto a different random path
+            engine.streams = RandomStreams(overrides["seed"])
+    else:
+        config = SimulationConfig()
+        if args.scenario:
+            # Imported here as scenario builds on this module
+            from scenario import load_scenario
+            try:
+                config = load_scenario(args.scenario)
+            except (OSError, ValueError) as e:
+                parser.error(str(e))
+        engine = Engine(replace(config, **overrides))
+        engine.start()
+    if args.transmissions:
+        from transmissions import TransmissionLog
+        engine.transmissions = TransmissionLog(args.transmissions)
+        engine.transmissions.attach(engine.population, engine.ticks)
+    if args.density_out:
+        from density import DensityGrid
+        engine.density = DensityGrid(engine.map_width, engine.map_height,
+                                     path=args.density_out, every=args.density_every)
+        engine.density.update(engine.population, engine.ticks)
+    if args.workers > 1:
+        from parallel import ParallelEngine
+        engine = ParallelEngine.from_engine(engine, args.workers)
+
+    if args.profile_out:
+        engine.timer = PhaseTimer(out_path=args.profile_out)
+    timer = engine.timer
+
+    try:
+        elapsed = run_ticks(engine, args)
+        if args.checkpoint:
+            from checkpoint import save_checkpoint
+            save_checkpoint(engine, args.checkpoint)
+    finally:
+        engine.close()
+
+    counts = engine.counts()
+    for name in STATUS_NAMES:
+        print(f"{name.capitalize()}: {counts[name]}")
+    print(f"Total: {len(engine.population)}")
+    print(f"{args.ticks} ticks in {elapsed:.2f}s ({args.ticks / max(elapsed, 1e-9):.0f} ticks/s)")
+    if args.profile_out:
+        for line in format_summary(timer.summary()):
+            print(line)
+        timer.close()
+
+
+def run_ticks(engine, args):
+    # Steps the run as the command line asked; returns the seconds taken
+    timer = engine.timer
+    start = time.perf_counter()
+    if args.stats_out:
+        recorder = StatsRecorder(args.stats_out)
+        recorder.record(engine.ticks, engine.time, engine.population.counts())
+        for _ in range(args.ticks):
+            with timer.phase("step"):
+                engine.step()
+            with timer.phase("record"):
+                recorder.record(engine.ticks, engine.time, engine.population.counts(),
+                                engine.population.incidence())
+            timer.end_frame(tick=engine.ticks)
+        recorder.close()
+    elif args.profile_out:
+        for _ in range(args.ticks):
+            with timer.phase("step"):
+                engine.step()
+            timer.end_frame(tick=engine.ticks)
+    else:
+        engine.run(args.ticks)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    main()
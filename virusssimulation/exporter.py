@@ -0,0 +1,171 @@
+import csv
+import os
+import queue
+import shutil
+import struct
+import subprocess
+import threading
+import zlib
+
+import numpy as np
+
+# Frames waiting to be written; past this the drop policy skips new ones
+# and the block policy makes the caller wait for the writer
+MAX_QUEUED_FRAMES = 8
+DROP = "drop"
+BLOCK = "block"
+POLICIES = (DROP, BLOCK)
+
+# Fast settings: a 1080p frame takes tens of milliseconds, not hundreds
+PNG_LEVEL = 1
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".webm", ".avi", ".mov")
+ENCODER = "ffmpeg"
+
+
+def encode_png(pixels, width, height, level=PNG_LEVEL):
+    # 8-bit RGB PNG from packed RGB bytes. zlib does the work and releases
+    # the GIL while it runs, so this is cheap to call from a thread.
+    rows = np.empty((height, width * 3 + 1), dtype=np.uint8)
+    rows[:, 0] = 0  # No filter
+    rows[:, 1:] = np.frombuffer(pixels, dtype=np.uint8).reshape(height, width * 3)
+
+    def chunk(kind, data):
+        return (struct.pack(">I", len(data)) + kind + data +
+                struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) +
+            chunk(b"IDAT", zlib.compress(rows.tobytes(), level)) + chunk(b"IEND", b""))
+
+
+class PngSequence:
+    # One numbered PNG per frame in a directory
+    def __init__(self, directory, width, height, fps):
+        self.directory = directory
+        self.width = width
+        self.height = height
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, index, pixels):
+        path = os.path.join(self.directory, f"frame_{index:06d}.png")
+        with open(path, "wb") as f:
+            f.write(encode_png(pixels, self.width, self.height))
+
+    def close(self):
+        pass
+
+
+class VideoPipe:
+    # Raw RGB frames piped to a local encoder process (ffmpeg by default)
+    def __init__(self, path, width, height, fps, encoder=ENCODER):
+        executable = shutil.which(encoder)
+        if executable is None:
+            raise FileNotFoundError(f"Video recording needs '{encoder}' on the PATH")
+        self.process = subprocess.Popen(
+            [executable, "-y", "-loglevel", "error",
+             "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", f"{fps:g}",
+             "-i", "-", "-pix_fmt", "yuv420p", path],
+            stdin=subprocess.PIPE)
+
+    def write(self, index, pixels):
+        self.process.stdin.write(pixels)
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+class FrameExporter:
+    # Records frames and their tick counters without the caller ever
+    # touching the disk. The caller hands over a copy of the screen and a
+    # metrics row; a background thread encodes and writes them. Frames in
+    # flight are bounded: when the writer falls behind, new frames are
+    # dropped (DROP) or the caller waits for a free slot (BLOCK). Metrics
+    # rows are small and always kept, with a column saying whether the
+    # frame made it.
+    #
+    # `path` is a directory for a PNG sequence, or a video file name
+    # (.mp4, .mkv, ...) to pipe to the encoder. Metrics go to metrics.csv
+    # in the directory, or next to the video with a .csv extension.
+    def __init__(self, path, width, height, fields, fps=60, max_queued=MAX_QUEUED_FRAMES,
+                 policy=DROP, encoder=ENCODER):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown drop policy '{policy}', expected one of {', '.join(POLICIES)}")
+        if max_queued < 1:
+            raise ValueError(f"max_queued must be at least 1, not {max_queued}")
+        self.policy = policy
+        self.fields = list(fields)
+        if path.lower().endswith(VIDEO_EXTENSIONS):
+            self.sink = VideoPipe(path, width, height, fps, encoder)
+            self.metrics_path = os.path.splitext(path)[0] + ".csv"
+        else:
+            self.sink = PngSequence(path, width, height, fps)
+            self.metrics_path = os.path.join(path, "metrics.csv")
+        self.path = path
+        self.items = queue.SimpleQueue()
+        self.slots = threading.Semaphore(max_queued)
+        self.frames = 0
+        self.written = 0
+        self.dropped = 0
+        self.error = None
+        self.thread = threading.Thread(target=self._write_loop, name="frame-exporter", daemon=True)
+        self.thread.start()
+
+    def capture(self, grab, row):
+        # `grab()` returns the frame's packed RGB bytes; it is only called
+        # when the frame will be kept. Returns whether it was.
+        kept = self.error is None and self.slots.acquire(blocking=self.policy == BLOCK)
+        index = self.frames
+        self.frames += 1
+        if kept:
+            self.items.put((index, grab(), row))
+        else:
+            self.dropped += 1
+            self.items.put((index, None, row))
+        return kept
+
+    def _write_loop(self):
+        metrics = None
+        try:
+            with open(self.metrics_path, "w", newline="") as f:
+                metrics = csv.writer(f)
+                metrics.writerow(["frame", "kept"] + self.fields)
+                while True:
+                    item = self.items.get()
+                    if item is None:
+                        break
+                    index, pixels, row = item
+                    metrics.writerow([index, int(pixels is not None)] + list(row))
+                    if pixels is not None:
+                        try:
+                            self.sink.write(index, pixels)
+                            self.written += 1
+                        finally:
+                            self.slots.release()
+        except Exception as e:
+            # Disk full, encoder gone, ...: later frames are dropped and
+            # close() reports it
+            self.error = e
+            self._discard()
+        finally:
+            try:
+                self.sink.close()
+            except Exception as e:
+                self.error = self.error or e
+
+    def _discard(self):
+        # Keep releasing slots so a blocking caller is never stuck
+        while True:
+            item = self.items.get()
+            if item is None:
+                return
+            if item[1] is not None:
+                self.slots.release()
+
+    def close(self):
+        # Waits for everything queued to be written; raises what the writer
+        # thread ran into, if anything
+        self.items.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
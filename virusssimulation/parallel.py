@@ -0,0 +1,259 @@
+import multiprocessing as mp
+import os
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from engine import DT, Engine
+from population import DEAD, HEALTHY, INFECTED, POPULATION_ARRAYS, STATUS_NAMES, Population
+from spatial_grid import SpatialGrid
+from transmissions import EDGE_DTYPE, make_edges
+
+# Shared arrays start on cache line boundaries
+ALIGNMENT = 64
+
+# Tile edges follow the crowd: every this many ticks they are moved so each
+# worker gets the same number of living agents
+REBALANCE_TICKS = 60
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _views(buffer, layout):
+    # {name: array} over a shared block, from a {name: (dtype, shape, offset)} layout
+    return {name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=buffer, offset=offset)
+            for name, (dtype, shape, offset) in layout.items()}
+
+
+def _in_tile(x, left, right):
+    return np.flatnonzero((x >= left) & (x < right))
+
+
+def _worker(index, workers, shm_name, layout, city, map_width, map_height, streams, barrier, conn):
+    # Steps the agents of tile `index` on command. Every tick has three
+    # phases with a barrier after each: move the tile's agents; note who in
+    # the tile is infected or healthy and which infected are in its halo;
+    # then infect the tile's healthy and resolve the infections this
+    # worker has queued. Those are infected people, whom no other worker
+    # writes to, so writes never overlap and reads never race a write.
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arrays = _views(shm.buf, layout)
+    population = Population(0)
+    for name in POPULATION_ARRAYS:
+        setattr(population, name, arrays[name])
+    population.recount()
+    bounds = arrays["bounds"]
+    try:
+        while True:
+            command = conn.recv()
+            if command is None:
+                break
+            ticks, dt, radius, now, reschedule, tick, log = command
+            try:
+                if population.grid.cell_size != max(1.0, radius):
+                    population.grid = SpatialGrid(radius)
+                population.time = now
+                population.tick = tick
+                if reschedule:
+                    # Each worker resolves an even share of the infections
+                    # running now, wherever those people walk to
+                    population.reschedule(np.arange(index, len(population), workers))
+                left, right = bounds[index], bounds[index + 1]
+                owned = _in_tile(population.x, left, right)
+                # Nobody may move until every worker has read the positions
+                barrier.wait()
+                population.case_log = [] if log else None
+                edges = []
+                for _ in range(ticks):
+                    population.begin_tick()
+                    population.move(city, map_width, map_height, streams, owned)
+                    barrier.wait()
+                    owned = _in_tile(population.x, left, right)
+                    status = population.status[owned]
+                    infected = owned[status == INFECTED]
+                    healthy = owned[status == HEALTHY]
+                    halo = _in_tile(population.x, left - radius, right + radius)
+                    sources = halo[population.status[halo] == INFECTED]
+                    barrier.wait()
+                    population.update(dt, city, map_width, map_height, streams,
+                                      infected=infected, healthy=healthy, sources=sources)
+                    if log:
+                        for infectors, infectees in population.case_log:
+                            edges.append(make_edges(population.tick, infectors, infectees,
+                                                    population.x[infectees], population.y[infectees]))
+                        population.case_log.clear()
+                    barrier.wait()
+                arrays["transitions"][index] = population.transitions
+                # Success is the transmissions of the batch, if logged
+                conn.send(np.concatenate(edges) if edges else np.empty(0, EDGE_DTYPE))
+            except Exception:
+                # Release the others from the barrier; the engine is done for
+                barrier.abort()
+                conn.send(traceback.format_exc())
+    finally:
+        # The views must go before the block can be closed
+        del arrays, population, bounds
+        shm.close()
+
+
+class ParallelEngine(Engine):
+    # Steps one large run on several cores. The map is cut into vertical
+    # tiles, one per worker process, and every agent array lives in shared
+    # memory. Each worker moves and infects only the agents in its tile;
+    # agents that walk over an edge simply belong to the next tile on the
+    # following tick. Infection across an edge comes from a halo, the
+    # infected within one infection radius outside the tile. Infections end
+    # from the queue of the worker that started them, or for those running
+    # at launch, of the worker given their share.
+    #
+    # Random numbers are drawn per agent from the run's RandomStreams, so a
+    # run gives exactly the same results as on the serial Engine, whatever
+    # the number of workers. Call close() (or use `with`) when done.
+    def __init__(self, config, workers=None, city=None):
+        super().__init__(config, city)
+        self.workers = workers or os.cpu_count() or 1
+        self.shm = None
+        self.shared = None
+        self.processes = []
+        self.pipes = []
+        self.reschedule = False
+
+    @classmethod
+    def from_engine(cls, engine, workers=None):
+        # Continue a running serial engine, e.g. one loaded from a checkpoint
+        parallel = cls(engine.config, workers, engine.city)
+        for name in ("streams", "population", "time", "ticks", "running", "timer", "transmissions", "density"):
+            setattr(parallel, name, getattr(engine, name))
+        parallel.launch()
+        return parallel
+
+    def start(self):
+        self.stop()
+        super().start()
+        self.launch()
+
+    def launch(self):
+        population = self.population
+        layout = {}
+        offset = 0
+        for name in POPULATION_ARRAYS:
+            array = getattr(population, name)
+            layout[name] = (array.dtype.str, array.shape, offset)
+            offset = _align(offset + array.nbytes)
+        layout["bounds"] = ("<f8", (self.workers + 1,), offset)
+        offset = _align(offset + 8 * (self.workers + 1))
+        layout["transitions"] = ("<i8", (self.workers, len(STATUS_NAMES), len(STATUS_NAMES)), offset)
+        offset += 8 * self.workers * len(STATUS_NAMES) ** 2
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        self.shared = _views(self.shm.buf, layout)
+        for name in POPULATION_ARRAYS:
+            self.shared[name][...] = getattr(population, name)
+            setattr(population, name, self.shared[name])
+        self.shared["bounds"][0] = -np.inf
+        self.shared["bounds"][-1] = np.inf
+        self.rebalance()
+
+        context = mp.get_context()
+        barrier = context.Barrier(self.workers)
+        for index in range(self.workers):
+            parent, child = context.Pipe()
+            process = context.Process(
+                target=_worker, daemon=True,
+                args=(index, self.workers, self.shm.name, layout, self.city, self.map_width, self.map_height,
+                      self.streams, barrier, child))
+            process.start()
+            child.close()
+            self.processes.append(process)
+            self.pipes.append(parent)
+        self.reschedule = True
+
+    def configure(self, config):
+        super().configure(config)
+        # The workers requeue running infections for the new recovery time
+        self.reschedule = True
+
+    def rebalance(self):
+        x = self.population.x
+        alive = x[self.population.status != DEAD]
+        if len(alive):
+            self.shared["bounds"][1:-1] = np.quantile(alive, np.arange(1, self.workers) / self.workers)
+        else:
+            self.shared["bounds"][1:-1] = np.arange(1, self.workers) / self.workers * self.map_width
+
+    def step(self, dt=DT):
+        self.run(1, dt)
+
+    def run(self, ticks, dt=DT):
+        while ticks > 0:
+            if self.ticks % REBALANCE_TICKS == 0:
+                self.rebalance()
+            batch = min(ticks, REBALANCE_TICKS - self.ticks % REBALANCE_TICKS)
+            if self.density is not None:
+                # The cell counts are taken after every tick
+                batch = 1
+            self.command(batch, dt)
+            for _ in range(batch):
+                self.time += dt
+                self.population.time += dt
+            self.ticks += batch
+            ticks -= batch
+            if self.density is not None:
+                self.density.update(self.population, self.ticks)
+
+    def command(self, ticks, dt):
+        population = self.population
+        radius = float(population.infection_radius.max()) if len(population) else 0.0
+        for pipe in self.pipes:
+            pipe.send((ticks, dt, radius, population.time, self.reschedule, self.ticks,
+                       self.transmissions is not None))
+        self.reschedule = False
+        results = [pipe.recv() for pipe in self.pipes]
+        errors = [result for result in results if isinstance(result, str)]
+        if errors:
+            self.stop()
+            # Report the worker that failed, not the ones it left at the barrier
+            errors.sort(key=lambda error: "BrokenBarrierError" in error)
+            raise RuntimeError("Simulation worker failed:\n" + errors[0])
+        population.transitions[:] = self.shared["transitions"].sum(axis=0)
+        population.status_counts[:] = np.bincount(population.status, minlength=len(STATUS_NAMES))
+        if self.transmissions is not None:
+            # Workers return their tiles' edges; put them in the serial order
+            edges = np.concatenate(results)
+            self.transmissions.extend(edges[np.lexsort((edges["infectee"], edges["tick"]))])
+
+    def stop(self):
+        # Stop the workers and take the agent arrays back out of shared memory
+        for pipe in self.pipes:
+            try:
+                pipe.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join()
+        for pipe in self.pipes:
+            pipe.close()
+        self.processes = []
+        self.pipes = []
+        if self.shm is not None:
+            for name in POPULATION_ARRAYS:
+                setattr(self.population, name, np.array(getattr(self.population, name)))
+            self.population.reschedule()
+            self.shared = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def close(self):
+        self.stop()
+        super().close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
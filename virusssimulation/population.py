@@ -0,0 +1,348 @@
+import numpy as np
+
+from profiling import NULL_TIMER
+from scheduler import EventQueue
+from spatial_grid import SpatialGrid
+from streams import INFECT_STREAM, RESOLVE_STREAM, SEEK_STREAM, WANDER_STREAM
+
+# Status codes stored in Population.status
+HEALTHY = 0
+INFECTED = 1
+RECOVERED = 2
+DEAD = 3
+STATUS_NAMES = ("healthy", "infected", "recovered", "dead")
+STATUS_CODES = {name: code for code, name in enumerate(STATUS_NAMES)}
+INCIDENCE_NAMES = ("new_infections", "new_recoveries", "new_deaths")
+
+# Target codes stored in Population.target_type
+NO_TARGET = 0
+TARGET_HOSPITAL = 1
+TARGET_CEMETERY = 2
+TARGET_NAMES = (None, "hospital", "cemetery")
+TARGET_CODES = {name: code for code, name in enumerate(TARGET_NAMES)}
+
+# Event kinds in Population.events
+RESOLVE_INFECTION = 0
+
+# Per-agent state arrays, everything needed to rebuild a Population; the
+# counters and the event queue are derived from them
+POPULATION_ARRAYS = (
+    "x", "y", "vx", "vy", "status", "infected_at", "resolve_at",
+    "target_x", "target_y", "target_type",
+    "recovery_time", "death_chance", "recovery_chance",
+    "infection_radius", "infection_chance",
+)
+
+PERSON_SIZE = 5
+MAX_SPEED = 2
+WANDER = 0.2
+ARRIVAL_DISTANCE = 5
+INFECTION_CHANCE = 0.4
+HOSPITAL_SEEK_CHANCE = 0.01
+
+
+class Population:
+    # Structure-of-arrays store for every agent. Each tick runs as a handful
+    # of array operations over the whole population instead of one Python
+    # call per person.
+    def __init__(self, count):
+        self.x = np.zeros(count)
+        self.y = np.zeros(count)
+        self.vx = np.zeros(count)
+        self.vy = np.zeros(count)
+        self.status = np.full(count, HEALTHY, dtype=np.int8)
+        # Model time each agent was infected, and when that infection
+        # resolves (inf for anyone not infected)
+        self.infected_at = np.zeros(count)
+        self.resolve_at = np.full(count, np.inf)
+        self.target_x = np.zeros(count)
+        self.target_y = np.zeros(count)
+        self.target_type = np.full(count, NO_TARGET, dtype=np.int8)
+
+        # Per-agent parameters
+        self.recovery_time = np.full(count, 10.0)
+        self.death_chance = np.full(count, 0.2)
+        self.recovery_chance = np.full(count, 0.8)
+        self.infection_radius = np.full(count, 10.0)
+        self.infection_chance = np.full(count, INFECTION_CHANCE)
+
+        # Live counts per status and this tick's (old, new) status changes,
+        # kept up to date by set_status
+        self.status_counts = np.zeros(len(STATUS_NAMES), dtype=np.int64)
+        self.status_counts[HEALTHY] = count
+        self.transitions = np.zeros((len(STATUS_NAMES), len(STATUS_NAMES)), dtype=np.int64)
+
+        # Model clock in seconds, and what happens to whom when. Only due
+        # events are looked at each tick, so nobody carries a timer.
+        self.time = 0.0
+        self.events = EventQueue()
+        # Ticks stepped so far; with the agent index it picks the random
+        # numbers drawn for each agent
+        self.tick = 0
+        # When a list, infect() appends (infectors, infectees) to it; see
+        # transmissions.TransmissionLog
+        self.case_log = None
+
+        self.grid = SpatialGrid(10)
+
+    @classmethod
+    def spawn(cls, count, num_infected, x_range, y_range, speed, rng,
+              infection_radius=10, infection_chance=INFECTION_CHANCE, death_chance=0.2,
+              recovery_chance=0.8, recovery_time=10):
+        population = cls(count)
+        population.x[:] = rng.integers(x_range[0], x_range[1], size=count, endpoint=True)
+        population.y[:] = rng.integers(y_range[0], y_range[1], size=count, endpoint=True)
+        population.vx[:] = rng.uniform(-speed, speed, size=count)
+        population.vy[:] = rng.uniform(-speed, speed, size=count)
+        population.set_status(np.arange(min(num_infected, count)), INFECTED)
+        # The initial seeding is not incidence
+        population.transitions[:] = 0
+
+        population.set_parameters(infection_radius, infection_chance, death_chance,
+                                  recovery_chance, recovery_time)
+        return population
+
+    def set_parameters(self, infection_radius, infection_chance, death_chance,
+                       recovery_chance, recovery_time):
+        # Same values for everyone; also used to change them mid-run
+        self.infection_radius[:] = infection_radius
+        self.infection_chance[:] = infection_chance
+        self.death_chance[:] = death_chance
+        self.recovery_chance[:] = recovery_chance
+        self.recovery_time[:] = recovery_time
+        self.grid = SpatialGrid(infection_radius)
+        # Running infections take the new recovery time
+        self.reschedule()
+
+    def __len__(self):
+        return len(self.x)
+
+    def set_status(self, indices, status):
+        # Every status change goes through here, so the counters stay exact
+        # without ever rescanning the population. `indices` must be unique.
+        indices = np.asarray(indices, dtype=np.int64)
+        if indices.size == 0:
+            return
+        old = self.status[indices]
+        changes = np.bincount(old, minlength=len(STATUS_NAMES))
+        changes[status] = 0
+        self.status_counts -= changes
+        self.status_counts[status] += changes.sum()
+        self.transitions[:, status] += changes
+        self.status[indices] = status
+        if status == INFECTED:
+            self.infected_at[indices] = self.time
+            self.schedule(indices)
+        else:
+            self.resolve_at[indices] = np.inf
+
+    def schedule(self, indices):
+        # Queue the end of these agents' infections
+        self.resolve_at[indices] = self.infected_at[indices] + self.recovery_time[indices]
+        self.events.push(RESOLVE_INFECTION, indices, self.resolve_at[indices])
+
+    def reschedule(self, agents=None):
+        # Rebuild the event queue from the arrays, e.g. after a checkpoint
+        # was loaded. With `agents`, only their infections are queued.
+        self.events.clear()
+        if agents is None:
+            self.schedule(np.flatnonzero(self.status == INFECTED))
+        else:
+            self.schedule(agents[self.status[agents] == INFECTED])
+
+    def begin_tick(self):
+        self.tick += 1
+        self.transitions[:] = 0
+
+    def recount(self):
+        # Rebuild the counters from scratch, e.g. after the status array
+        # was filled in directly from a checkpoint
+        self.status_counts[:] = np.bincount(self.status, minlength=len(STATUS_NAMES))
+        self.transitions[:] = 0
+
+    def step(self, dt, city, map_width, map_height, streams, timer=NULL_TIMER):
+        # `city` is the world.CityIndex of the current layout and `streams`
+        # the streams.RandomStreams of the run
+        self.begin_tick()
+        with timer.phase("move"):
+            self.move(city, map_width, map_height, streams)
+        self.update(dt, city, map_width, map_height, streams, timer)
+
+    def move(self, city, map_width, map_height, streams, agents=None):
+        # `agents` limits the move to those indices, e.g. one worker's tile
+        if agents is None:
+            alive = np.flatnonzero(self.status != DEAD)
+        else:
+            alive = agents[self.status[agents] != DEAD]
+        has_target = self.target_type[alive] != NO_TARGET
+
+        # Follow the destination's navigation field along the streets,
+        # then head straight for the centre once inside, until close enough
+        idx = alive[has_target]
+        if len(idx):
+            self.steer(idx, city)
+
+        # Everyone else wanders, capped at MAX_SPEED
+        idx = alive[~has_target]
+        if len(idx):
+            wander = WANDER * (2 * streams.random(WANDER_STREAM, self.tick, idx, 2) - 1)
+            vx = self.vx[idx] + wander[:, 0]
+            vy = self.vy[idx] + wander[:, 1]
+            speed = np.sqrt(vx*vx + vy*vy)
+            scale = np.where(speed > MAX_SPEED, MAX_SPEED / np.maximum(speed, 1e-12), 1.0)
+            self.vx[idx] = vx * scale
+            self.vy[idx] = vy * scale
+
+        idx = alive
+        x = self.x[idx] + self.vx[idx]
+        y = self.y[idx] + self.vy[idx]
+
+        # Keep within map bounds
+        np.clip(x, 0, map_width, out=x)
+        np.clip(y, 0, map_height, out=y)
+
+        # Push anyone who walked into a building back out, except people
+        # entering the hospital or cemetery they are heading for
+        ids = city.lookup(x, y)
+        hit = np.flatnonzero(ids >= 0)
+        if len(hit):
+            target = self.target_type[idx[hit]]
+            ids[hit[(target != NO_TARGET) & (city.type_of(ids[hit]) == target)]] = -1
+            city.push_out(x, y, ids)
+            np.clip(x, 0, map_width, out=x)
+            np.clip(y, 0, map_height, out=y)
+
+        self.x[idx] = x
+        self.y[idx] = y
+
+    def steer(self, idx, city):
+        for code in np.unique(self.target_type[idx]):
+            group = idx[self.target_type[idx] == code]
+            field = city.navigation(TARGET_NAMES[code])
+            cells = field.cells_of(self.x[group], self.y[group])
+            self.vx[group] = field.flow_x[cells] * MAX_SPEED
+            self.vy[group] = field.flow_y[cells] * MAX_SPEED
+
+            # The field has no direction inside a destination or off the
+            # street grid; there, walk straight at the target
+            straight = np.flatnonzero(field.distance[cells] <= 0)
+            if len(straight) == 0:
+                continue
+            cells = cells[straight]
+            group = group[straight]
+            # Inside a destination, aim for the one actually reached; ties
+            # in the field can lead to a different one than first picked
+            goal = field.goal[cells]
+            inside = goal >= 0
+            self.target_x[group[inside]] = field.goal_x[goal[inside]]
+            self.target_y[group[inside]] = field.goal_y[goal[inside]]
+
+            dx = self.target_x[group] - self.x[group]
+            dy = self.target_y[group] - self.y[group]
+            dist = np.sqrt(dx*dx + dy*dy)
+            going = dist > ARRIVAL_DISTANCE
+            self.vx[group[going]] = dx[going] / dist[going] * MAX_SPEED
+            self.vy[group[going]] = dy[going] / dist[going] * MAX_SPEED
+            self.target_type[group[~going]] = NO_TARGET
+
+    def update(self, dt, city, map_width, map_height, streams, timer=NULL_TIMER,
+               infected=None, healthy=None, sources=None):
+        # The parallel engine passes who in its tile was infected and who
+        # healthy after the move, and `sources`, the infected in and around
+        # the tile; only those people are updated or can be infected
+        self.time += dt
+        if infected is None:
+            infected = np.flatnonzero(self.status == INFECTED)
+        if sources is None:
+            sources = infected
+
+        # Infected people try to go to the nearest hospital by the streets
+        field = city.navigation('hospital')
+        if len(infected) and field.reachable:
+            idle = infected[self.target_type[infected] == NO_TARGET]
+            seeking = idle[streams.random(SEEK_STREAM, self.tick, idle) < HOSPITAL_SEEK_CHANCE]
+            goal = field.goal[field.cells_of(self.x[seeking], self.y[seeking])]
+            # Nobody is cut off from every hospital on the generated
+            # layouts; anyone who is just keeps wandering
+            seeking = seeking[goal >= 0]
+            goal = goal[goal >= 0]
+            self.target_x[seeking] = field.goal_x[goal]
+            self.target_y[seeking] = field.goal_y[goal]
+            self.target_type[seeking] = TARGET_HOSPITAL
+
+        # Everyone infected at the start of the tick gets to spread the
+        # virus, including those who resolve below
+        if len(sources):
+            with timer.phase("infect"):
+                self.infect(sources, map_width, map_height, streams, healthy)
+
+        due = self.events.pop_due(self.time).get(RESOLVE_INFECTION)
+        if due is not None:
+            # Skip events overtaken by a status change or a reschedule
+            due = np.unique(due)
+            due = due[(self.status[due] == INFECTED) & (self.resolve_at[due] <= self.time)]
+            draws = streams.random(RESOLVE_STREAM, self.tick, due, 2)
+            dies = draws[:, 0] < self.death_chance[due]
+            recovers = draws[:, 1] < self.recovery_chance[due]
+            self.set_status(due[dies], DEAD)
+            self.set_status(due[~dies & recovers], RECOVERED)
+            self.set_status(due[~dies & ~recovers], HEALTHY)
+
+    def infect(self, sources, map_width, map_height, streams, healthy=None):
+        if healthy is None:
+            healthy = np.flatnonzero(self.status == HEALTHY)
+        if len(healthy) == 0:
+            return
+        self.grid.build(self.x, self.y, healthy, map_width, map_height, len(sources))
+        query, target = self.grid.candidate_pairs(self.x[sources], self.y[sources])
+        if len(target) == 0:
+            return
+        source = sources[query]
+        dx = self.x[source] - self.x[target]
+        dy = self.y[source] - self.y[target]
+        radius = self.infection_radius[source]
+        close = dx*dx + dy*dy < radius*radius
+        if not np.any(close):
+            return
+        # Every infected person in range passes the virus on with their
+        # infection chance. That is decided per target with one draw, going
+        # through the sources by index: the target escapes the first k with
+        # probability `escape`, so the first to pass it on is the first at
+        # which the draw falls below 1 - escape. The order the pairs were
+        # found in, which differs between the serial and parallel engines,
+        # never matters.
+        order = np.lexsort((source[close], target[close]))
+        source = source[close][order]
+        target = target[close][order]
+        starts = np.flatnonzero(np.r_[True, target[1:] != target[:-1]])
+        targets = target[starts]
+        sizes = np.diff(np.r_[starts, len(target)])
+        draws = streams.random(INFECT_STREAM, self.tick, targets)
+        chance = self.infection_chance[source]
+        escape = np.ones(len(targets))
+        infector = np.full(len(targets), -1)
+        # Targets with the most sources first, so those still going at
+        # each rank are a prefix
+        by_size = np.argsort(-sizes, kind="stable")
+        remaining = np.searchsorted(-sizes[by_size], -np.arange(sizes.max()), side="left")
+        for rank, count in enumerate(remaining):
+            group = by_size[:count]
+            pair = starts[group] + rank
+            escape[group] *= 1 - chance[pair]
+            first = (infector[group] < 0) & (draws[group] < 1 - escape[group])
+            infector[group[first]] = source[pair[first]]
+        hit = infector >= 0
+        self.set_status(targets[hit], INFECTED)
+        if self.case_log is not None and np.any(hit):
+            self.case_log.append((infector[hit], targets[hit]))
+
+    def counts(self):
+        return self.status_counts.copy()
+
+    def incidence(self):
+        # New infections, recoveries and deaths during the last tick
+        return (
+            int(self.transitions[:, INFECTED].sum()),
+            int(self.transitions[INFECTED, RECOVERED]),
+            int(self.transitions[:, DEAD].sum()),
+        )
@@ -0,0 +1,151 @@
+import cProfile
+import io
+import json
+import pstats
+import time
+
+import numpy as np
+
+# Timings kept per phase for the rolling percentiles
+PROFILE_WINDOW = 240
+
+
+class _NullPhase:
+    # Returned by a disabled timer: entering and leaving it does nothing
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    __slots__ = ("timer", "name", "start")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class PhaseTimer:
+    # Rolling wall-clock timings per named phase (event handling, movement,
+    # drawing, ...). Code wraps each phase in `with timer.phase(name):`;
+    # while disabled that is a shared no-op, so the hooks can stay in the
+    # hot path. With `out_path`, every frame's phase totals are also
+    # written as one JSON object per line.
+    def __init__(self, enabled=True, window=PROFILE_WINDOW, out_path=None):
+        self.enabled = enabled
+        self.window = window
+        self.phases = {}
+        self.samples = {}
+        self.counts = {}
+        self.frame = {}
+        self.out = open(out_path, "w") if out_path else None
+
+    def phase(self, name):
+        if not self.enabled:
+            return _NULL_PHASE
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = _Phase(self, name)
+        return phase
+
+    def record(self, name, seconds):
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = [0.0] * self.window
+            self.counts[name] = 0
+        samples[self.counts[name] % self.window] = seconds
+        self.counts[name] += 1
+        if self.out is not None:
+            self.frame[name] = self.frame.get(name, 0.0) + seconds
+
+    def end_frame(self, **fields):
+        # Write this frame's totals per phase, in milliseconds
+        if self.out is None or not self.enabled:
+            return
+        fields["phases"] = {name: round(seconds * 1000, 4) for name, seconds in self.frame.items()}
+        self.out.write(json.dumps(fields) + "\n")
+        self.frame.clear()
+
+    def summary(self):
+        # {phase: {"p50", "p95", "max" in ms, "count"}} over the last `window` samples
+        result = {}
+        for name, samples in self.samples.items():
+            count = self.counts[name]
+            recent = np.array(samples[:min(count, self.window)]) * 1000
+            p50, p95 = np.percentile(recent, (50, 95))
+            result[name] = {"p50": float(p50), "p95": float(p95), "max": float(recent.max()), "count": count}
+        return result
+
+    def reset(self):
+        self.samples.clear()
+        self.counts.clear()
+        self.frame.clear()
+
+    def close(self):
+        if self.out is not None:
+            self.out.write(json.dumps({"summary": self.summary()}) + "\n")
+            self.out.close()
+            self.out = None
+
+
+def format_summary(summary):
+    # One aligned text line per phase, slowest median first
+    lines = [f"{'phase':<12}{'p50':>8}{'p95':>8}{'max':>8}  ms"]
+    for name, s in sorted(summary.items(), key=lambda item: -item[1]["p50"]):
+        lines.append(f"{name:<12}{s['p50']:>8.2f}{s['p95']:>8.2f}{s['max']:>8.2f}")
+    return lines
+
+
+# Shared disabled timer, the default wherever no profiling was asked for
+NULL_TIMER = PhaseTimer(enabled=False)
+
+
+class ProfileCapture:
+    # Runs cProfile over the next `frames` frames, then saves the raw stats
+    # (for snakeviz, pstats, ...) and returns a short text report
+    def __init__(self):
+        self.profile = None
+        self.remaining = 0
+        self.path = None
+
+    @property
+    def active(self):
+        return self.profile is not None
+
+    def start(self, frames, path):
+        if self.active:
+            return
+        self.profile = cProfile.Profile()
+        self.remaining = frames
+        self.path = path
+        self.profile.enable()
+
+    def frame_done(self, top=20):
+        # Call once per frame; returns the report when the capture finishes
+        if not self.active:
+            return None
+        self.remaining -= 1
+        if self.remaining > 0:
+            return None
+        self.profile.disable()
+        self.profile.dump_stats(self.path)
+        report = io.StringIO()
+        pstats.Stats(self.profile, stream=report).sort_stats("cumulative").print_stats(top)
+        self.profile = None
+        return report.getvalue()
@@ -0,0 +1,121 @@
+import numpy as np
+
+from population import INCIDENCE_NAMES, STATUS_NAMES
+
+# `run` counts the runs recorded so far, for a UI session that starts or
+# loads several runs into the same file
+STATS_DTYPE = np.dtype([("run", np.int32), ("tick", np.int64), ("time", np.float64)] +
+                       [(name, np.int32) for name in STATUS_NAMES + INCIDENCE_NAMES])
+
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+
+
+class NpyAppender:
+    # Streams rows of a structured dtype into a 1-D .npy file. The header is
+    # rewritten with the current row count after every append, so the file
+    # is a valid array at all times and np.load works on it mid-run.
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        self.file = open(path, "wb")
+        # Size the header for the largest possible row count so it never
+        # has to grow; pad to a multiple of 64 bytes like numpy does
+        longest = len(self._header_text(2**63 - 1)) + len(NPY_MAGIC) + 2
+        self.header_size = -(-longest // 64) * 64
+        self._write_header()
+
+    def _header_text(self, rows):
+        descr = np.lib.format.dtype_to_descr(self.dtype)
+        return "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (descr, rows)
+
+    def _write_header(self):
+        text = self._header_text(self.rows)
+        header_len = self.header_size - len(NPY_MAGIC) - 2
+        header = text.ljust(header_len - 1) + "\n"
+        self.file.seek(0)
+        self.file.write(NPY_MAGIC + header_len.to_bytes(2, "little") + header.encode("latin1"))
+        self.file.seek(0, 2)
+
+    def append(self, rows):
+        rows = np.ascontiguousarray(rows, dtype=self.dtype)
+        if len(rows) == 0:
+            return
+        self.file.write(rows.tobytes())
+        self.rows += len(rows)
+        self._write_header()
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self._write_header()
+            self.file.close()
+
+
+class StatsRecorder:
+    # Per-tick status counts in a fixed-size ring buffer. With a path, full
+    # chunks are streamed to an .npy file, so memory stays bounded however
+    # long the run is; without one only the most recent rows are kept.
+    def __init__(self, path=None, capacity=4096):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=STATS_DTYPE)
+        self.count = 0
+        self.flushed = 0
+        self.run = 0
+        self.writer = NpyAppender(path, STATS_DTYPE) if path else None
+
+    def record(self, tick, time, counts, incidence=(0, 0, 0)):
+        if self.count - self.flushed == self.capacity:
+            self.flush()
+        self.buffer[self.count % self.capacity] = (self.run, tick, time, *counts, *incidence)
+        self.count += 1
+
+    def pending(self):
+        # Rows recorded since the last flush, oldest first
+        start = self.flushed % self.capacity
+        end = start + (self.count - self.flushed)
+        if end <= self.capacity:
+            return self.buffer[start:end]
+        return np.concatenate((self.buffer[start:], self.buffer[:end - self.capacity]))
+
+    def flush(self):
+        if self.writer is not None:
+            self.writer.append(self.pending())
+        # Without a file the oldest rows are simply overwritten
+        self.flushed = self.count
+
+    def latest(self):
+        if self.count == 0:
+            return None
+        return self.buffer[(self.count - 1) % self.capacity]
+
+    def history(self):
+        # The rows still held in memory, oldest first
+        start = max(0, self.count - self.capacity)
+        index = np.arange(start, self.count) % self.capacity
+        return self.buffer[index]
+
+    def reproduction_number(self, infectious_period, window=60):
+        # R(t) over the last `window` rows: new infections per infected
+        # person-second, times how long someone stays infectious
+        rows = self.history()[-window:]
+        if len(rows) < 2:
+            return None
+        dt = (rows["time"][-1] - rows["time"][0]) / (len(rows) - 1)
+        exposure = rows["infected"][:-1].sum() * dt
+        if exposure <= 0:
+            return None
+        return rows["new_infections"][1:].sum() / exposure * infectious_period
+
+    def reset(self):
+        # Rows recorded after this belong to the next run
+        self.flush()
+        if self.count:
+            self.run += 1
+        self.count = 0
+        self.flushed = 0
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
@@ -0,0 +1,76 @@
+import json
+from dataclasses import fields, replace
+
+from engine import SimulationConfig
+from world import MAP_SIZES
+
+try:
+    import tomllib
+except ImportError:
+    # Before Python 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+# A scenario file sets any of the SimulationConfig fields: the eight slider
+# values, the map size and the seed, e.g. in TOML
+#
+#   population = 5000
+#   infection_radius = 12
+#   death_chance_pct = 5
+#   map_size = "Large"
+#   seed = 1
+#
+# or the same keys in a JSON object. Dashes may be used for underscores.
+# The seed may also be null, for a fresh one every run
+SCENARIO_FIELDS = {field.name: int if field.name == "seed" else field.type for field in fields(SimulationConfig)}
+TYPE_NAMES = {int: "a whole number", float: "a number", str: "text"}
+
+
+def read_scenario(path):
+    # {field: value} as written in the file, checked but not yet applied
+    if path.lower().endswith(".toml"):
+        if tomllib is None:
+            raise ValueError(f"Reading {path} needs Python 3.11 or the 'tomli' package")
+        with open(path, "rb") as f:
+            try:
+                data = tomllib.load(f)
+            except tomllib.TOMLDecodeError as e:
+                raise ValueError(f"{path}: {e}") from None
+    else:
+        with open(path, encoding="utf-8") as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}: {e}") from None
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: expected a table of settings")
+
+    values = {}
+    for key, value in data.items():
+        name = key.replace("-", "_")
+        if name not in SCENARIO_FIELDS:
+            raise ValueError(f"{path}: unknown setting '{key}', expected one of {', '.join(SCENARIO_FIELDS)}")
+        if name == "seed" and value is None:
+            values[name] = None
+            continue
+        kind = SCENARIO_FIELDS[name]
+        # Whole numbers may be written as 5000.0, but not 5000.5
+        if kind is int and isinstance(value, float) and value.is_integer():
+            value = int(value)
+        if isinstance(value, bool) or not isinstance(value, (int, float) if kind is float else kind):
+            raise ValueError(f"{path}: '{key}' must be {TYPE_NAMES[kind]}, not {value!r}")
+        values[name] = kind(value)
+    if values.get("seed") is not None and values["seed"] < 0:
+        raise ValueError(f"{path}: 'seed' must be 0 or more, not {values['seed']}")
+    if "map_size" in values and values["map_size"] not in MAP_SIZES:
+        raise ValueError(f"{path}: unknown map size '{values['map_size']}', "
+                         f"expected one of {', '.join(MAP_SIZES)}")
+    return values
+
+
+def load_scenario(path, base=None):
+    # The SimulationConfig a scenario file describes; settings the file
+    # leaves out keep their value in `base` (the defaults if None)
+    return replace(base or SimulationConfig(), **read_scenario(path))
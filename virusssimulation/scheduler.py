@@ -0,0 +1,47 @@
+import heapq
+import itertools
+
+import numpy as np
+
+
+class EventQueue:
+    # Future per-agent events (an infection resolving, and later stages
+    # such as the end of an incubation period) in a min-heap by time.
+    # Events are pushed and popped in batches: every agent given the same
+    # time in one push shares a heap entry, so a tick costs a few heap
+    # operations however many agents it schedules or resolves.
+    def __init__(self):
+        self.heap = []
+        self.order = itertools.count()  # Keeps equal times first in, first out
+        self.count = 0
+
+    def push(self, kind, agents, times):
+        agents = np.asarray(agents, dtype=np.int64)
+        if agents.size == 0:
+            return
+        times = np.broadcast_to(np.asarray(times, dtype=np.float64), agents.shape)
+        order = np.argsort(times, kind="stable")
+        times = times[order]
+        agents = agents[order]
+        starts = np.flatnonzero(np.r_[True, times[1:] != times[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(agents)]):
+            heapq.heappush(self.heap, (float(times[start]), next(self.order), kind, agents[start:end]))
+        self.count += len(agents)
+
+    def pop_due(self, now):
+        # {kind: agents} of every event at or before `now`, oldest first.
+        # An agent may be listed twice if it was scheduled twice; callers
+        # check the event still applies.
+        due = {}
+        while self.heap and self.heap[0][0] <= now:
+            _, _, kind, agents = heapq.heappop(self.heap)
+            due.setdefault(kind, []).append(agents)
+            self.count -= len(agents)
+        return {kind: np.concatenate(parts) for kind, parts in due.items()}
+
+    def clear(self):
+        self.heap.clear()
+        self.count = 0
+
+    def __len__(self):
+        return self.count
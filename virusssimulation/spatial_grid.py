@@ -0,0 +1,86 @@
+import numpy as np
+
+# Offsets of the 3x3 block of cells around a query point
+NEIGHBOUR_OFFSETS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+# A dense per-cell table is only worth building when there are not many
+# more cells than agents plus queries; sparser grids binary search the
+# sorted keys
+MAX_DENSE_CELLS = 4_000_000
+DENSE_CELLS_PER_AGENT = 8
+
+
+class SpatialGrid:
+    # Uniform grid over the map, stored as agent indices sorted by cell.
+    # With the cell size equal to the infection radius, everyone within
+    # range of a point sits in the 3x3 block of cells around it.
+    def __init__(self, cell_size):
+        self.cell_size = max(1.0, float(cell_size))
+        self.rows = 1
+        self.order = np.empty(0, dtype=np.int64)
+        self.sorted_keys = np.empty(0, dtype=np.int64)
+        self.cell_start = None
+
+    def cells_of(self, x, y):
+        # Shift by one so the neighbours of edge cells never alias a real
+        # cell in the next column
+        cx = np.floor(x / self.cell_size).astype(np.int64) + 1
+        cy = np.floor(y / self.cell_size).astype(np.int64) + 1
+        return cx, cy
+
+    def key(self, cx, cy):
+        return cx * self.rows + cy
+
+    def build(self, x, y, indices, map_width, map_height, queries=0):
+        # Index the given agents by cell, for about `queries` lookups. The
+        # table leaves a spare row and column around the map so offset keys
+        # stay unique.
+        self.rows = int(map_height // self.cell_size) + 4
+        cells = (int(map_width // self.cell_size) + 4) * self.rows
+        cx, cy = self.cells_of(x[indices], y[indices])
+        keys = self.key(cx, cy)
+        order = np.argsort(keys, kind="stable")
+        self.sorted_keys = keys[order]
+        self.order = indices[order]
+        if cells <= min(MAX_DENSE_CELLS, DENSE_CELLS_PER_AGENT * (len(indices) + queries)):
+            self.cell_start = np.zeros(cells + 1, dtype=np.int64)
+            np.cumsum(np.bincount(keys, minlength=cells), out=self.cell_start[1:])
+        else:
+            self.cell_start = None
+
+    def ranges(self, keys):
+        # [start, end) slice of `order` holding each cell's agents
+        if self.cell_start is not None:
+            return self.cell_start[keys], self.cell_start[keys + 1]
+        start = np.searchsorted(self.sorted_keys, keys, side="left")
+        end = np.searchsorted(self.sorted_keys, keys, side="right")
+        return start, end
+
+    def candidate_pairs(self, qx, qy):
+        # All (query, agent) pairs whose cells touch. Returns positions into
+        # the query arrays and agent indices from the last build().
+        if len(qx) == 0 or len(self.order) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+        cx, cy = self.cells_of(qx, qy)
+        queries = np.arange(len(qx))
+        query_parts = []
+        agent_parts = []
+        for dx, dy in NEIGHBOUR_OFFSETS:
+            start, end = self.ranges(self.key(cx + dx, cy + dy))
+            counts = end - start
+            total = counts.sum()
+            if total == 0:
+                continue
+            # Expand each [start, end) range into one entry per agent
+            offsets = np.cumsum(counts) - counts
+            within = np.arange(total) - np.repeat(offsets, counts)
+            query_parts.append(np.repeat(queries, counts))
+            agent_parts.append(self.order[np.repeat(start, counts) + within])
+        if not query_parts:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+        return np.concatenate(query_parts), np.concatenate(agent_parts)
+
+    def __len__(self):
+        return len(self.order)
@@ -0,0 +1,67 @@
+import numpy as np
+
+# What a stream is for. Every purpose gets its own key, so adding draws
+# for one never shifts the numbers of another.
+SPAWN_STREAM = 0
+CITY_STREAM = 1
+WANDER_STREAM = 2
+SEEK_STREAM = 3
+INFECT_STREAM = 4
+RESOLVE_STREAM = 5
+STREAM_COUNT = 6
+
+# Agents per block. Each block of agents has its own stream every tick.
+BLOCK_SIZE = 1 << 13
+
+
+class RandomStreams:
+    # All randomness of a run, derived from one seed. Draws come from
+    # Philox, a counter-based generator: the stream for (purpose, tick,
+    # block of agents) is its key and counter, so it can be started
+    # anywhere without stepping through the ones before it. An agent's
+    # numbers then depend only on the seed, the tick and its index, never
+    # on which other agents were drawn for, in what order, or by which
+    # process. Serial and parallel runs with the same seed therefore give
+    # the same trajectories.
+    def __init__(self, seed=None):
+        # Without a seed, one is picked and kept so the run can be repeated
+        sequence = np.random.SeedSequence(seed)
+        self.seed = sequence.entropy
+        self.keys = [np.random.SeedSequence(self.seed, spawn_key=(stream,)).generate_state(2, np.uint64)
+                     for stream in range(STREAM_COUNT)]
+
+    def generator(self, stream, tick=0, block=0):
+        # An ordinary numpy Generator, for one-off sequential draws such as
+        # spawning people or laying out the city
+        return np.random.Generator(np.random.Philox(key=self.keys[stream], counter=[0, 0, block, tick]))
+
+    def random(self, stream, tick, agents, width=1):
+        # Uniform [0, 1) numbers for `agents` (an index array) on `tick`,
+        # `width` per agent: agent i gets row i of its block's stream.
+        # `agents` must be unique. Returns shape (len(agents),), or
+        # (len(agents), width) if width > 1.
+        agents = np.asarray(agents, dtype=np.int64)
+        out = np.empty((len(agents), width))
+        if len(agents):
+            order = None
+            if np.any(agents[1:] < agents[:-1]):
+                order = np.argsort(agents, kind="stable")
+                agents = agents[order]
+            blocks = agents // BLOCK_SIZE
+            edges = np.flatnonzero(np.r_[True, blocks[1:] != blocks[:-1], True])
+            draws = np.empty_like(out)
+            for start, end in zip(edges[:-1], edges[1:]):
+                block = int(blocks[start])
+                local = agents[start:end] - block * BLOCK_SIZE
+                generator = self.generator(stream, tick, block)
+                if local[-1] == end - start - 1:
+                    # The first agents of the block, all of them: no gaps
+                    # to skip, so draw straight into place
+                    generator.random(out=draws[start:end])
+                else:
+                    draws[start:end] = generator.random((int(local[-1]) + 1, width))[local]
+            if order is None:
+                out = draws
+            else:
+                out[order] = draws
+        return out if width > 1 else out[:, 0]
@@ -0,0 +1,180 @@
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+
+import numpy as np
+
+from engine import DT, Engine, SimulationConfig, positive_int, seed_arg
+from population import STATUS_NAMES
+from scenario import load_scenario
+from world import MAP_SIZES
+
+# The eight slider parameters a sweep can vary
+PARAMETERS = (
+    "population",
+    "initial_infected_pct",
+    "infection_radius",
+    "infection_chance_pct",
+    "death_chance_pct",
+    "recovery_chance_pct",
+    "recovery_time",
+    "movement_speed",
+)
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def parse_values(text):
+    # "a,b,c" is a list of values, "start:stop:count" an inclusive range
+    if ":" in text:
+        start, stop, count = text.split(":")
+        if int(count) < 1:
+            raise ValueError(f"a range needs at least 1 value, not {count}")
+        return [float(v) for v in np.linspace(float(start), float(stop), int(count))]
+    return [float(v) for v in text.split(",")]
+
+
+def non_negative_int(text):
+    value = int(text)
+    if value < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or more, not {value}")
+    return value
+
+
+def parameter_grid(ranges):
+    # Every combination of the given values, as a list of {name: value}
+    names = list(ranges)
+    for name in names:
+        if name not in PARAMETERS:
+            raise ValueError(f"Unknown parameter '{name}', expected one of {', '.join(PARAMETERS)}")
+    return [dict(zip(names, values)) for values in itertools.product(*(ranges[n] for n in names))]
+
+
+def run_seed(base_seed, set_index, run_index):
+    # Depends only on the run's place in the sweep, never on which worker
+    # picked it up, so a sweep is reproducible on any number of cores
+    sequence = np.random.SeedSequence(base_seed, spawn_key=(set_index, run_index))
+    return int(sequence.generate_state(1, np.uint64)[0])
+
+
+def run_once(config, ticks, sample_every):
+    # One seeded run; returns the counts per status every `sample_every` ticks
+    engine = Engine(config)
+    engine.start()
+    curve = np.empty((ticks // sample_every + 1, len(STATUS_NAMES)), dtype=np.int32)
+    curve[0] = engine.population.counts()
+    for sample in range(1, len(curve)):
+        engine.run(sample_every)
+        curve[sample] = engine.population.counts()
+    return curve
+
+
+def _run_task(task):
+    return run_once(*task)
+
+
+def sweep(base_config, grid, runs, ticks, sample_every=60, seed=0, workers=None):
+    configs = []
+    tasks = []
+    for set_index, params in enumerate(grid):
+        params = dict(params)
+        if "population" in params:
+            params["population"] = int(params["population"])
+        configs.append(replace(base_config, **params))
+        for run_index in range(runs):
+            run_config = replace(configs[-1], seed=run_seed(seed, set_index, run_index))
+            tasks.append((run_config, ticks, sample_every))
+
+    workers = workers or os.cpu_count() or 1
+    # Several runs per task keeps the pickling overhead small next to the work
+    chunksize = max(1, len(tasks) // (workers * 4))
+    if workers == 1:
+        curves = [_run_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            curves = list(executor.map(_run_task, tasks, chunksize=chunksize))
+
+    samples = ticks // sample_every + 1
+    curves = np.stack(curves).reshape(len(grid), runs, samples, len(STATUS_NAMES))
+    return {
+        "configs": configs,
+        "time": np.arange(samples) * sample_every * DT,
+        "curves": curves,
+        "mean": curves.mean(axis=1),
+        "percentiles": np.percentile(curves, PERCENTILES, axis=1),
+    }
+
+
+def save(result, path, keep_runs=False):
+    arrays = {
+        "time": result["time"],
+        "mean": result["mean"],
+        "percentiles": result["percentiles"],
+        "percentile_levels": np.array(PERCENTILES),
+        "status_names": np.array(STATUS_NAMES),
+        "parameter_names": np.array(PARAMETERS),
+        "parameters": np.array([[getattr(c, name) for name in PARAMETERS] for c in result["configs"]],
+                               dtype=float),
+    }
+    if keep_runs:
+        arrays["curves"] = result["curves"]
+    np.savez_compressed(path, **arrays)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte Carlo parameter sweep over a process pool")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUES",
+                        help="vary a parameter, e.g. infection_radius=5,10,15 or death_chance_pct=0:50:6")
+    parser.add_argument("--runs", type=positive_int, default=100, help="seeded runs per parameter set")
+    parser.add_argument("--ticks", type=non_negative_int, default=3600)
+    parser.add_argument("--sample-every", type=positive_int, default=60, help="ticks between curve samples")
+    parser.add_argument("--scenario", metavar="PATH",
+                        help="settings every run starts from, in a .toml or .json file (its seed is not used)")
+    parser.add_argument("--map-size", choices=list(MAP_SIZES), help="(default: the scenario's, or Small)")
+    parser.add_argument("--seed", type=seed_arg, default=0, help="base seed for the whole sweep")
+    parser.add_argument("--workers", type=non_negative_int, default=None,
+                        help="worker processes (default or 0: all cores)")
+    parser.add_argument("--out", default="sweep.npz")
+    parser.add_argument("--keep-runs", action="store_true", help="also save every individual curve")
+    args = parser.parse_args(argv)
+
+    ranges = {}
+    try:
+        for item in args.set:
+            name, _, values = item.partition("=")
+            ranges[name.strip().replace("-", "_")] = parse_values(values)
+        grid = parameter_grid(ranges)
+    except ValueError as e:
+        parser.error(f"--set: {e}")
+
+    base = SimulationConfig()
+    if args.scenario:
+        try:
+            base = load_scenario(args.scenario)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    if args.map_size:
+        base = replace(base, map_size=args.map_size)
+
+    start = time.perf_counter()
+    result = sweep(base, grid, args.runs, args.ticks,
+                   args.sample_every, args.seed, args.workers)
+    elapsed = time.perf_counter() - start
+    save(result, args.out, args.keep_runs)
+
+    median = PERCENTILES.index(50)
+    infected = STATUS_NAMES.index("infected")
+    for i in range(len(grid)):
+        params = ", ".join(f"{name}={value:g}" for name, value in grid[i].items()) or "defaults"
+        final = ", ".join(f"{name} {value:.1f}" for name, value in zip(STATUS_NAMES, result["mean"][i, -1]))
+        peak = result["percentiles"][median, i, :, infected].max()
+        print(f"{params}: mean final {final}; median peak infected {peak:.0f}")
+    total_runs = len(grid) * args.runs
+    print(f"{total_runs} runs in {elapsed:.1f}s ({total_runs / elapsed:.1f} runs/s), saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The modules import each other by name, as when run from this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import SimulationConfig
+from population import POPULATION_ARRAYS
+
+
+@pytest.fixture
+def config():
+    # Small but busy: most people are infected within a second or two, and
+    # short infections end in recoveries and deaths during the run
+    return SimulationConfig(population=1500, initial_infected_pct=5, infection_radius=20,
+                            infection_chance_pct=60, death_chance_pct=20, recovery_chance_pct=70,
+                            recovery_time=1, movement_speed=2, map_size="Small", seed=7)
+
+
+def assert_same_state(a, b):
+    # Two engines hold exactly the same run
+    assert a.ticks == b.ticks
+    assert a.time == pytest.approx(b.time)
+    assert a.counts() == b.counts()
+    for name in POPULATION_ARRAYS:
+        np.testing.assert_array_equal(getattr(a.population, name), getattr(b.population, name), err_msg=name)
@@ -0,0 +1,77 @@
+from dataclasses import replace
+
+import pytest
+
+from checkpoint import load_checkpoint, save_checkpoint
+from engine import Engine
+from parallel import ParallelEngine
+
+from .conftest import assert_same_state
+
+
+@pytest.fixture
+def uninterrupted(config):
+    engine = Engine(config)
+    engine.start()
+    engine.run(120)
+    return engine
+
+
+@pytest.fixture
+def saved(config, tmp_path):
+    # A checkpoint halfway through the same run
+    engine = Engine(config)
+    engine.start()
+    engine.run(50)
+    path = tmp_path / "run.vsim"
+    save_checkpoint(engine, path)
+    return path
+
+
+def test_resume_matches_uninterrupted_run(uninterrupted, saved):
+    resumed = load_checkpoint(saved)
+    assert resumed.ticks == 50
+    resumed.run(70)
+    assert_same_state(uninterrupted, resumed)
+
+
+def test_save_over_loaded_checkpoint(uninterrupted, saved):
+    # The loaded state no longer depends on the file
+    resumed = load_checkpoint(saved)
+    save_checkpoint(resumed, saved)
+    resumed.run(70)
+    assert_same_state(uninterrupted, resumed)
+    assert load_checkpoint(saved).ticks == 50
+
+
+def test_resume_on_workers_matches_uninterrupted_run(uninterrupted, saved):
+    with ParallelEngine.from_engine(load_checkpoint(saved), 2) as resumed:
+        resumed.run(70)
+        assert_same_state(uninterrupted, resumed)
+
+
+def test_chunked_city_resumes(config, tmp_path):
+    # Giant maps are generated in chunks and rebuilt from their seed
+    config = replace(config, map_size="Giant", population=3000)
+    engine = Engine(config)
+    engine.start()
+    engine.run(20)
+    save_checkpoint(engine, tmp_path / "giant.vsim")
+    engine.run(20)
+    resumed = load_checkpoint(tmp_path / "giant.vsim")
+    resumed.run(20)
+    assert_same_state(engine, resumed)
+
+
+def test_truncated_checkpoint(saved):
+    data = saved.read_bytes()
+    saved.write_bytes(data[:len(data) // 2])
+    with pytest.raises(ValueError, match="truncated"):
+        load_checkpoint(saved)
+
+
+def test_not_a_checkpoint(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("not a checkpoint at all")
+    with pytest.raises(ValueError, match="not a simulation checkpoint"):
+        load_checkpoint(path)
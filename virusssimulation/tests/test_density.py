@@ -0,0 +1,46 @@
+import numpy as np
+
+from density import DensityGrid
+from engine import Engine
+from parallel import REBALANCE_TICKS, ParallelEngine
+from population import STATUS_NAMES
+from recorder import StatsRecorder
+
+TICKS = 120
+
+
+def test_density_matches_stats(config, tmp_path):
+    # Per-cell counts recorded alongside the stats file, the way
+    # engine.py --density-out does
+    engine = Engine(config)
+    engine.density = DensityGrid(engine.map_width, engine.map_height, path=tmp_path / "density.npy")
+    engine.start()
+    recorder = StatsRecorder(tmp_path / "stats.npy")
+    recorder.record(engine.ticks, engine.time, engine.population.counts())
+    for _ in range(TICKS):
+        engine.step()
+        recorder.record(engine.ticks, engine.time, engine.population.counts(), engine.population.incidence())
+    recorder.close()
+    engine.close()
+    stats = np.load(tmp_path / "stats.npy")
+    density = np.load(tmp_path / "density.npy")
+    np.testing.assert_array_equal(density["tick"], stats["tick"])
+    for name in STATUS_NAMES:
+        np.testing.assert_array_equal(density[name].sum(axis=(1, 2)), stats[name], err_msg=name)
+    np.testing.assert_array_equal(density["new_infections"][1:].sum(axis=(1, 2)), stats["new_infections"][1:])
+    # Cases add up the people infected at the start and every new infection
+    assert density["cases"][-1].sum() == stats["infected"][0] + stats["new_infections"].sum()
+
+
+def test_parallel_density_matches_serial(config):
+    ticks = REBALANCE_TICKS + 30
+    serial = Engine(config)
+    serial.density = DensityGrid(serial.map_width, serial.map_height)
+    serial.start()
+    serial.run(ticks)
+    parallel = ParallelEngine(config, 2)
+    parallel.density = DensityGrid(parallel.map_width, parallel.map_height)
+    with parallel:
+        parallel.start()
+        parallel.run(ticks)
+        np.testing.assert_array_equal(serial.density.layers, parallel.density.layers)
@@ -0,0 +1,67 @@
+from dataclasses import replace
+
+import numpy as np
+
+from engine import Engine
+
+from .conftest import assert_same_state
+
+
+def run(config, ticks, city=None):
+    engine = Engine(config, city)
+    engine.start()
+    curve = [engine.counts()]
+    for _ in range(ticks):
+        engine.step()
+        curve.append(engine.counts())
+    return engine, curve
+
+
+def test_same_seed_same_run(config):
+    first, first_curve = run(config, 120)
+    second, second_curve = run(config, 120)
+    assert first_curve == second_curve
+    assert_same_state(first, second)
+
+
+def test_different_seed_different_run(config):
+    _, first_curve = run(config, 120)
+    _, second_curve = run(replace(config, seed=8), 120)
+    assert first_curve != second_curve
+
+
+def test_restart_replays_the_seed(config):
+    engine, curve = run(config, 60)
+    engine.start()
+    engine.run(60)
+    assert engine.counts() == curve[-1]
+
+
+def test_unseeded_run_keeps_its_seed(config):
+    # A run without a seed can be repeated on the same city from the seed
+    # it picked, as checkpoints do
+    engine, curve = run(replace(config, seed=None), 60)
+    _, again = run(replace(config, seed=engine.streams.seed), 60, engine.city)
+    assert again == curve
+
+
+def test_counts_match_statuses(config):
+    engine, _ = run(config, 120)
+    counts = engine.counts()
+    assert sum(counts.values()) == config.population
+    assert counts["recovered"] > 0 and counts["dead"] > 0
+
+
+def test_live_counters_follow_every_transition(config):
+    engine = Engine(config)
+    engine.start()
+    population = engine.population
+    previous = population.counts()
+    for _ in range(120):
+        engine.step()
+        counts = population.counts()
+        np.testing.assert_array_equal(counts, np.bincount(population.status, minlength=len(counts)))
+        # People arriving in each status minus those leaving it
+        transitions = population.transitions
+        np.testing.assert_array_equal(counts - previous, transitions.sum(axis=0) - transitions.sum(axis=1))
+        previous = counts
@@ -0,0 +1,11 @@
+import pytest
+
+from exporter import FrameExporter
+
+
+@pytest.mark.parametrize("max_queued", [0, -1])
+def test_queue_needs_a_slot(tmp_path, max_queued):
+    # With no slot a BLOCK exporter would wait forever on its first frame
+    with pytest.raises(ValueError, match="max_queued"):
+        FrameExporter(str(tmp_path / "frames"), 64, 48, ["tick"], max_queued=max_queued)
+    assert not (tmp_path / "frames").exists()
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from engine import Engine
+from parallel import REBALANCE_TICKS, ParallelEngine
+from population import DEAD
+
+from .conftest import assert_same_state
+
+# Long enough to cross a tile rebalance
+TICKS = REBALANCE_TICKS + 30
+
+
+def check_consistent(engine, config):
+    population = engine.population
+    counts = population.counts()
+    assert counts.sum() == config.population
+    np.testing.assert_array_equal(counts, np.bincount(population.status, minlength=len(counts)))
+    alive = population.status != DEAD
+    assert np.all((population.x[alive] >= 0) & (population.x[alive] <= engine.map_width))
+    assert np.all((population.y[alive] >= 0) & (population.y[alive] <= engine.map_height))
+
+
+@pytest.mark.parametrize("workers", [1, 2, 3])
+def test_parallel_run_stays_consistent(config, workers):
+    with ParallelEngine(config, workers) as engine:
+        engine.start()
+        engine.run(TICKS)
+        assert engine.ticks == TICKS
+        check_consistent(engine, config)
+    # The arrays are back out of shared memory after close()
+    check_consistent(engine, config)
+    counts = engine.counts()
+    assert counts["recovered"] > 0 and counts["dead"] > 0
+
+
+def run_serial(config, ticks):
+    engine = Engine(config)
+    engine.start()
+    engine.run(ticks)
+    return engine
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_parallel_matches_serial(config, workers):
+    serial = run_serial(config, TICKS)
+    with ParallelEngine(config, workers) as parallel:
+        parallel.start()
+        parallel.run(TICKS)
+        assert_same_state(serial, parallel)
+
+
+def test_parallel_steps_match_batches(config):
+    # One tick per command, as with a density grid, or many at once
+    with ParallelEngine(config, 2) as parallel:
+        parallel.start()
+        for _ in range(TICKS):
+            parallel.step()
+        assert_same_state(run_serial(config, TICKS), parallel)
+
+
+def test_parallel_continues_a_serial_run(config):
+    serial = Engine(config)
+    serial.start()
+    serial.run(30)
+    with ParallelEngine.from_engine(serial, 2) as engine:
+        assert engine.ticks == 30
+        engine.run(30)
+        assert engine.ticks == 60
+        check_consistent(engine, config)
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_same_seed_and_workers_same_run(config, workers):
+    # Every agent is moved by exactly one worker each tick, however the
+    # workers are scheduled
+    runs = []
+    for _ in range(3):
+        with ParallelEngine(config, workers) as engine:
+            engine.start()
+            engine.run(TICKS)
+        runs.append(engine)
+    for other in runs[1:]:
+        assert_same_state(runs[0], other)
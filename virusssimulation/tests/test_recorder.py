@@ -0,0 +1,75 @@
+import numpy as np
+
+from population import INCIDENCE_NAMES, STATUS_NAMES
+from recorder import STATS_DTYPE, NpyAppender, StatsRecorder
+
+
+def counts_at(tick):
+    return (1000 - tick, tick, tick // 2, tick // 3)
+
+
+def incidence_at(tick):
+    return (tick % 7, tick % 5, tick % 3)
+
+
+def test_appender_file_loads_after_every_append(tmp_path):
+    dtype = np.dtype([("a", np.int32), ("b", np.float64)])
+    path = tmp_path / "rows.npy"
+    writer = NpyAppender(path, dtype)
+    assert len(np.load(path)) == 0
+    written = []
+    for size in (1, 5, 0, 300):
+        rows = np.zeros(size, dtype=dtype)
+        rows["a"] = np.arange(len(written), len(written) + size)
+        rows["b"] = rows["a"] * 0.5
+        writer.append(rows)
+        written.extend(rows.tolist())
+        # Valid mid-run, before close()
+        assert np.load(path).tolist() == written
+    writer.close()
+    loaded = np.load(path)
+    assert loaded.dtype == dtype
+    assert loaded.tolist() == written
+
+
+def test_stats_file_across_several_flushes(tmp_path):
+    path = tmp_path / "stats.npy"
+    recorder = StatsRecorder(path, capacity=16)
+    for tick in range(100):
+        recorder.record(tick, tick / 60, counts_at(tick), incidence_at(tick))
+    # Full chunks are already on disk while the run goes on
+    assert len(np.load(path)) == 96
+    recorder.close()
+    rows = np.load(path)
+    assert rows.dtype == STATS_DTYPE
+    np.testing.assert_array_equal(rows["tick"], np.arange(100))
+    for i, name in enumerate(STATUS_NAMES):
+        np.testing.assert_array_equal(rows[name], [counts_at(tick)[i] for tick in range(100)])
+    for i, name in enumerate(INCIDENCE_NAMES):
+        np.testing.assert_array_equal(rows[name], [incidence_at(tick)[i] for tick in range(100)])
+
+
+def test_memory_only_keeps_the_latest_rows():
+    recorder = StatsRecorder(capacity=16)
+    assert recorder.latest() is None
+    for tick in range(40):
+        recorder.record(tick, tick / 60, counts_at(tick))
+    assert recorder.latest()["tick"] == 39
+    np.testing.assert_array_equal(recorder.history()["tick"], np.arange(24, 40))
+
+
+def test_runs_are_numbered_across_resets(tmp_path):
+    path = tmp_path / "stats.npy"
+    recorder = StatsRecorder(path, capacity=16)
+    for tick in range(20):
+        recorder.record(tick, tick / 60, counts_at(tick))
+    recorder.reset()
+    # A reset before anything was recorded does not skip a run number
+    recorder.reset()
+    recorder.reset()
+    for tick in range(5):
+        recorder.record(tick, tick / 60, counts_at(tick))
+    recorder.close()
+    rows = np.load(path)
+    np.testing.assert_array_equal(rows["run"], [0] * 20 + [1] * 5)
+    np.testing.assert_array_equal(rows["tick"], list(range(20)) + list(range(5)))
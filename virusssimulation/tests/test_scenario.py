@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+import scenario
+from engine import SimulationConfig
+from scenario import load_scenario, read_scenario
+
+
+def write_json(tmp_path, data):
+    path = tmp_path / "scenario.json"
+    path.write_text(json.dumps(data))
+    return str(path)
+
+
+@pytest.mark.skipif(scenario.tomllib is None, reason="needs Python 3.11 or tomli")
+def test_toml(tmp_path):
+    path = tmp_path / "scenario.toml"
+    path.write_text('population = 5000\ninfection-radius = 12\nmap_size = "Large"\nseed = 1\n')
+    config = load_scenario(str(path))
+    assert config == SimulationConfig(population=5000, infection_radius=12, map_size="Large", seed=1)
+
+
+def test_json_keeps_base_for_missing_settings(tmp_path):
+    base = SimulationConfig(population=300, death_chance_pct=5)
+    config = load_scenario(write_json(tmp_path, {"population": 800}), base)
+    assert config.population == 800
+    assert config.death_chance_pct == 5
+
+
+def test_numbers_are_converted(tmp_path):
+    values = read_scenario(write_json(tmp_path, {"population": 5000.0, "recovery_time": 3, "seed": None}))
+    assert values == {"population": 5000, "recovery_time": 3.0, "seed": None}
+    assert type(values["population"]) is int
+    assert type(values["recovery_time"]) is float
+
+
+@pytest.mark.parametrize("data, message", [
+    ({"populaton": 10}, "unknown setting 'populaton'"),
+    ({"population": 5000.5}, "'population' must be a whole number"),
+    ({"population": "many"}, "'population' must be a whole number"),
+    ({"infection_radius": True}, "'infection_radius' must be a number"),
+    ({"map_size": 3}, "'map_size' must be text"),
+    ({"map_size": "Tiny"}, "unknown map size 'Tiny'"),
+    ({"seed": 1.5}, "'seed' must be a whole number"),
+    ({"seed": -1}, "'seed' must be 0 or more"),
+    ([1, 2], "expected a table of settings"),
+])
+def test_invalid_settings(tmp_path, data, message):
+    with pytest.raises(ValueError, match=message):
+        read_scenario(write_json(tmp_path, data))
+
+
+def test_malformed_file(tmp_path):
+    path = tmp_path / "scenario.json"
+    path.write_text("{population: ")
+    with pytest.raises(ValueError, match="scenario.json"):
+        read_scenario(str(path))
@@ -0,0 +1,82 @@
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+from engine import Engine
+from population import HEALTHY, INFECTED
+from scheduler import EventQueue
+
+
+def test_pop_due_returns_events_up_to_now_oldest_first():
+    queue = EventQueue()
+    queue.push("resolve", [5, 6, 7], [3.0, 1.0, 2.0])
+    queue.push("resolve", [8], 1.0)
+    queue.push("other", [9, 10], 2.5)
+    assert len(queue) == 6
+    assert queue.pop_due(0.5) == {}
+    due = queue.pop_due(2.0)
+    assert list(due) == ["resolve"]
+    # By time, and in push order for equal times
+    assert due["resolve"].tolist() == [6, 8, 7]
+    assert len(queue) == 3
+    due = queue.pop_due(10)
+    assert due["other"].tolist() == [9, 10]
+    assert due["resolve"].tolist() == [5]
+    assert len(queue) == 0
+
+
+def test_agents_scheduled_twice_are_listed_twice():
+    queue = EventQueue()
+    queue.push("resolve", [1, 2], 1.0)
+    queue.push("resolve", [1], 2.0)
+    assert queue.pop_due(5)["resolve"].tolist() == [1, 2, 1]
+
+
+def test_empty_push_and_clear():
+    queue = EventQueue()
+    queue.push("resolve", [], [])
+    assert len(queue) == 0 and queue.pop_due(1) == {}
+    queue.push("resolve", [1, 2], 1.0)
+    queue.clear()
+    assert len(queue) == 0 and queue.pop_due(1) == {}
+
+
+@pytest.fixture
+def engine(config):
+    # Nobody new gets infected, so only the first infections resolve
+    engine = Engine(replace(config, infection_chance_pct=0, death_chance_pct=0, recovery_chance_pct=0))
+    engine.start()
+    return engine
+
+
+def test_infections_resolve_on_time(engine):
+    infected = engine.counts()["infected"]
+    assert infected > 0
+    engine.run(55)
+    assert engine.counts()["infected"] == infected
+    engine.run(10)
+    assert engine.counts()["infected"] == 0
+
+
+def test_rescheduled_infections_skip_their_old_event(engine):
+    infected = engine.counts()["infected"]
+    engine.configure(replace(engine.config, recovery_time=2))
+    engine.run(90)
+    assert engine.counts()["infected"] == infected
+    engine.run(40)
+    assert engine.counts()["infected"] == 0
+
+
+def test_reinfected_agents_skip_their_old_event(engine):
+    population = engine.population
+    engine.run(30)
+    agent = np.flatnonzero(population.status == INFECTED)[:1]
+    # Cured and infected again at 0.5 s: the event for 1 s no longer applies
+    population.set_status(agent, HEALTHY)
+    population.set_status(agent, INFECTED)
+    engine.run(35)
+    assert engine.counts()["infected"] == 1
+    assert population.status[agent[0]] == INFECTED
+    engine.run(30)
+    assert engine.counts()["infected"] == 0
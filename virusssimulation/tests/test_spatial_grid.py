@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+import spatial_grid
+from spatial_grid import SpatialGrid
+
+MAP_WIDTH, MAP_HEIGHT = 600, 400
+
+
+def brute_force_pairs(qx, qy, x, y, indices, radius):
+    dx = qx[:, None] - x[indices][None, :]
+    dy = qy[:, None] - y[indices][None, :]
+    query, agent = np.nonzero(dx * dx + dy * dy < radius * radius)
+    return set(zip(query.tolist(), indices[agent].tolist()))
+
+
+@pytest.fixture(params=["dense", "sparse"])
+def layout(request, monkeypatch):
+    if request.param == "sparse":
+        # Binary search the sorted keys instead of the per-cell table
+        monkeypatch.setattr(spatial_grid, "MAX_DENSE_CELLS", 0)
+    rng = np.random.default_rng(3)
+    x = rng.uniform(0, MAP_WIDTH, 3000)
+    y = rng.uniform(0, MAP_HEIGHT, 3000)
+    # Some agents sit right on the map edges
+    x[:20] = 0
+    y[20:40] = MAP_HEIGHT
+    return x, y
+
+
+@pytest.mark.parametrize("radius", [1, 7.5, 25])
+def test_candidate_pairs_match_brute_force(layout, radius):
+    x, y = layout
+    indices = np.flatnonzero(np.arange(len(x)) % 3 != 0)
+    queries = np.arange(0, len(x), 3)
+    grid = SpatialGrid(radius)
+    grid.build(x, y, indices, MAP_WIDTH, MAP_HEIGHT)
+    query, agent = grid.candidate_pairs(x[queries], y[queries])
+
+    pairs = list(zip(query.tolist(), agent.tolist()))
+    assert len(pairs) == len(set(pairs))
+    dx = x[queries][query] - x[agent]
+    dy = y[queries][query] - y[agent]
+    close = dx * dx + dy * dy < radius * radius
+    found = set(zip(query[close].tolist(), agent[close].tolist()))
+    assert found == brute_force_pairs(x[queries], y[queries], x, y, indices, radius)
+    # Candidates are never more than two cells apart
+    assert np.all(np.abs(dx) < 2 * grid.cell_size) and np.all(np.abs(dy) < 2 * grid.cell_size)
+
+
+def test_empty_grid_and_queries():
+    grid = SpatialGrid(10)
+    grid.build(np.zeros(0), np.zeros(0), np.zeros(0, dtype=np.int64), MAP_WIDTH, MAP_HEIGHT)
+    query, agent = grid.candidate_pairs(np.array([5.0]), np.array([5.0]))
+    assert len(query) == len(agent) == 0
+    grid.build(np.array([5.0]), np.array([5.0]), np.array([0]), MAP_WIDTH, MAP_HEIGHT)
+    query, agent = grid.candidate_pairs(np.zeros(0), np.zeros(0))
+    assert len(query) == len(agent) == 0
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from engine import SimulationConfig
+from sweep import main, parameter_grid, parse_values, run_seed, save, sweep
+
+BASE = SimulationConfig(population=300, infection_radius=15, recovery_time=1)
+
+
+def test_parse_values():
+    assert parse_values("5,10,15") == [5.0, 10.0, 15.0]
+    assert parse_values("0:50:6") == [0.0, 10.0, 20.0, 30.0, 40.0, 50.0]
+    for text in ("0:10:0", "0:10:-2", "", "5,,6"):
+        with pytest.raises(ValueError):
+            parse_values(text)
+
+
+def test_parameter_grid():
+    grid = parameter_grid({"infection_radius": [5, 10], "death_chance_pct": [0, 50]})
+    assert grid == [
+        {"infection_radius": 5, "death_chance_pct": 0},
+        {"infection_radius": 5, "death_chance_pct": 50},
+        {"infection_radius": 10, "death_chance_pct": 0},
+        {"infection_radius": 10, "death_chance_pct": 50},
+    ]
+    with pytest.raises(ValueError, match="Unknown parameter"):
+        parameter_grid({"radius": [5]})
+
+
+def test_run_seeds_are_distinct():
+    seeds = {run_seed(0, s, r) for s in range(4) for r in range(50)}
+    assert len(seeds) == 200
+
+
+@pytest.mark.parametrize("argv", [
+    ["--set", "radius=5,10"],
+    ["--set", "population=many"],
+    ["--runs", "0"],
+    ["--sample-every", "0"],
+    ["--seed", "-1"],
+    ["--set", "population=0:10:0"],
+    ["--ticks", "-5"],
+    ["--workers", "-1"],
+])
+def test_bad_arguments_are_usage_errors(argv, capsys):
+    with pytest.raises(SystemExit) as exit:
+        main(argv)
+    assert exit.value.code == 2
+    assert "usage:" in capsys.readouterr().err
+
+
+def test_same_results_on_one_and_two_workers():
+    grid = parameter_grid({"infection_radius": [5, 20]})
+    serial = sweep(BASE, grid, runs=3, ticks=90, sample_every=30, workers=1)
+    pooled = sweep(BASE, grid, runs=3, ticks=90, sample_every=30, workers=2)
+    np.testing.assert_array_equal(serial["curves"], pooled["curves"])
+    assert serial["curves"].shape == (2, 3, 4, 4)
+    # Every sample accounts for the whole population
+    assert np.all(serial["curves"].sum(axis=-1) == BASE.population)
+
+
+def test_save(tmp_path):
+    grid = parameter_grid({"infection_radius": [5, 20]})
+    result = sweep(BASE, grid, runs=2, ticks=60, sample_every=30, workers=1)
+    save(result, tmp_path / "sweep.npz", keep_runs=True)
+    data = np.load(tmp_path / "sweep.npz")
+    np.testing.assert_array_equal(data["curves"], result["curves"])
+    assert data["parameters"].shape == (2, len(data["parameter_names"]))
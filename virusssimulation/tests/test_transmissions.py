@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from engine import Engine
+from parallel import ParallelEngine
+from recorder import StatsRecorder
+from transmissions import TransmissionLog, generation_intervals, infection_tree, load_edges, secondary_cases
+
+TICKS = 120
+
+
+def logged_run(engine, tmp_path):
+    # Steps a run logging transmissions and recording stats the way
+    # engine.py --stats-out does; returns (stats rows, edges)
+    engine.transmissions = TransmissionLog(tmp_path / "edges.npy")
+    engine.start()
+    recorder = StatsRecorder(tmp_path / "stats.npy")
+    recorder.record(engine.ticks, engine.time, engine.population.counts())
+    for _ in range(TICKS):
+        engine.step()
+        recorder.record(engine.ticks, engine.time, engine.population.counts(), engine.population.incidence())
+    recorder.close()
+    engine.close()
+    return np.load(tmp_path / "stats.npy"), load_edges(tmp_path / "edges.npy")
+
+
+@pytest.fixture
+def run(config, tmp_path):
+    return logged_run(Engine(config), tmp_path)
+
+
+def check_matches_stats(stats, edges, config):
+    index_cases = edges["infector"] == -1
+    assert index_cases.sum() == stats["infected"][0] == int(config.population * config.initial_infected_pct / 100)
+    assert np.all(edges["tick"][index_cases] == 0)
+    per_tick = np.bincount(edges["tick"][~index_cases], minlength=TICKS + 1)
+    np.testing.assert_array_equal(per_tick, stats["new_infections"])
+    assert stats["new_infections"].sum() > 0
+
+
+def test_transmissions_match_stats(run, config):
+    stats, edges = run
+    check_matches_stats(stats, edges, config)
+
+
+def test_parallel_transmissions_match_stats(config, tmp_path):
+    stats, edges = logged_run(ParallelEngine(config, 2), tmp_path)
+    check_matches_stats(stats, edges, config)
+
+
+def test_transmission_log_order(run):
+    _, edges = run
+    order = np.lexsort((edges["infectee"], edges["tick"]))
+    np.testing.assert_array_equal(order, np.arange(len(edges)))
+
+
+def test_parallel_transmission_log_matches_serial(config, tmp_path):
+    serial = Engine(config)
+    serial.transmissions = TransmissionLog(tmp_path / "serial.npy")
+    serial.start()
+    serial.run(TICKS)
+    serial.close()
+    parallel = ParallelEngine(config, 3)
+    parallel.transmissions = TransmissionLog(tmp_path / "parallel.npy")
+    with parallel:
+        parallel.start()
+        parallel.run(TICKS)
+    assert (tmp_path / "serial.npy").read_bytes() == (tmp_path / "parallel.npy").read_bytes()
+
+
+def test_infection_tree(run):
+    _, edges = run
+    parent = infection_tree(edges)
+    linked = parent >= 0
+    # Every infection but the index cases was passed on by someone infected
+    # earlier, and is counted once as their secondary case
+    np.testing.assert_array_equal(linked, edges["infector"] >= 0)
+    np.testing.assert_array_equal(edges["infectee"][parent[linked]], edges["infector"][linked])
+    assert secondary_cases(edges, parent).sum() == linked.sum()
+    assert np.all(generation_intervals(edges, parent) > 0)
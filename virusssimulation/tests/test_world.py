@@ -0,0 +1,44 @@
+import numpy as np
+
+from world import BUILDING_TYPES, MAP_SIZES, ChunkedCity
+
+
+def sample_points(city, count=20000, seed=5):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(0, city.map_width, count), rng.uniform(0, city.map_height, count)
+
+
+def test_chunks_do_not_depend_on_cache_size():
+    # A city that keeps evicting chunks makes the same buildings as one
+    # that keeps them all
+    width, height = MAP_SIZES["Giant"]
+    roomy = ChunkedCity(width, height, seed=11)
+    cramped = ChunkedCity(width, height, seed=11, max_chunks=2)
+    x, y = sample_points(roomy)
+    for part in np.array_split(np.arange(len(x)), 50):
+        np.testing.assert_array_equal(roomy.lookup(x[part], y[part]), cramped.lookup(x[part], y[part]))
+    ids = np.unique(roomy.lookup(x, y))
+    ids = ids[ids >= 0]
+    np.testing.assert_array_equal(roomy.type_of(ids), cramped.type_of(ids))
+
+
+def test_lookup_agrees_with_rects():
+    width, height = MAP_SIZES["Huge"]
+    city = ChunkedCity(width, height, seed=3)
+    x, y = sample_points(city)
+    ids = city.lookup(x, y)
+    inside = ids >= 0
+    left, top, right, bottom = city.rects(ids[inside])
+    assert np.all((x[inside] >= left) & (x[inside] < right) & (y[inside] >= top) & (y[inside] < bottom))
+    # buildings_in lists every building a lookup can hit
+    listed = {(b.x, b.y) for b in city.buildings_in(0, 0, 5000, 5000)}
+    near = inside & (x < 5000) & (y < 5000)
+    left, top, _, _ = city.rects(ids[near])
+    assert set(zip(left.astype(int).tolist(), top.astype(int).tolist())) <= listed
+
+
+def test_every_destination_type_exists():
+    width, height = MAP_SIZES["Giant"]
+    city = ChunkedCity(width, height, seed=2)
+    codes = set(city.destinations.values())
+    assert {BUILDING_TYPES.index("hospital"), BUILDING_TYPES.index("cemetery")} <= codes
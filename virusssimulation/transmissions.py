@@ -0,0 +1,183 @@
+import argparse
+
+import numpy as np
+
+from population import INFECTED
+from recorder import NpyAppender
+
+# One row per infection: who passed it on (-1 for index cases), who got
+# it, the tick it happened on and where, ordered by tick and then infectee.
+# Agent ids are Population indices, which never change during a run.
+EDGE_DTYPE = np.dtype([("infector", np.int32), ("infectee", np.int32), ("tick", np.int32),
+                       ("x", np.float32), ("y", np.float32)])
+
+EDGE_BUFFER = 1 << 16
+
+
+def make_edges(tick, infectors, infectees, x, y):
+    edges = np.empty(len(infectees), dtype=EDGE_DTYPE)
+    edges["infector"] = infectors
+    edges["infectee"] = infectees
+    edges["tick"] = tick
+    edges["x"] = x
+    edges["y"] = y
+    return edges
+
+
+class TransmissionLog:
+    # Append-only edge list of who infected whom. Edges collect in a fixed
+    # array and are streamed to an .npy file whenever it fills, so memory
+    # stays flat for runs with millions of infections.
+    def __init__(self, path, capacity=EDGE_BUFFER):
+        self.buffer = np.zeros(capacity, dtype=EDGE_DTYPE)
+        self.count = 0
+        self.edges = 0
+        self.writer = NpyAppender(path, EDGE_DTYPE)
+
+    def attach(self, population, tick):
+        # Start logging a population's infections. Whoever is infected
+        # already goes in as an index case, with no infector.
+        population.case_log = []
+        seeds = np.flatnonzero(population.status == INFECTED)
+        self.add(tick, np.full(len(seeds), -1), seeds, population.x[seeds], population.y[seeds])
+
+    def record(self, tick, population):
+        # Log the infections of the tick the population just stepped, by
+        # infectee, so the rows do not depend on how the tick was stepped
+        edges = [make_edges(tick, infectors, infectees, population.x[infectees], population.y[infectees])
+                 for infectors, infectees in population.case_log]
+        population.case_log.clear()
+        if edges:
+            edges = np.concatenate(edges)
+            self.extend(edges[np.argsort(edges["infectee"], kind="stable")])
+
+    def add(self, tick, infectors, infectees, x, y):
+        self.extend(make_edges(tick, infectors, infectees, x, y))
+
+    def extend(self, edges):
+        if self.count + len(edges) > len(self.buffer):
+            self.flush()
+        if len(edges) > len(self.buffer):
+            self.writer.append(edges)
+        else:
+            self.buffer[self.count:self.count + len(edges)] = edges
+            self.count += len(edges)
+        self.edges += len(edges)
+
+    def flush(self):
+        self.writer.append(self.buffer[:self.count])
+        self.count = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def load_edges(path):
+    # Memory-mapped, so even very long logs open instantly
+    return np.load(path, mmap_mode="r")
+
+
+def infection_tree(edges):
+    # Links every infection to the one it came from. A person can be
+    # infected more than once, so infections (rows of `edges`) are the
+    # nodes, not people. Returns each row's parent row, -1 for index cases.
+    # The parent is the infector's latest infection before the tick.
+    edges = np.asarray(edges)
+    span = int(edges["tick"].max()) + 2 if len(edges) else 1
+    keys = edges["infectee"].astype(np.int64) * span + edges["tick"]
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    infector = edges["infector"].astype(np.int64)
+    parent = np.searchsorted(sorted_keys, infector * span + edges["tick"], side="left") - 1
+    found = (infector >= 0) & (parent >= 0)
+    found[found] = sorted_keys[parent[found]] // span == infector[found]
+    return np.where(found, order[np.maximum(parent, 0)], -1)
+
+
+def secondary_cases(edges, parent=None):
+    # Number of people each infection went on to infect
+    if parent is None:
+        parent = infection_tree(edges)
+    return np.bincount(parent[parent >= 0], minlength=len(edges))
+
+
+def generation_intervals(edges, parent=None):
+    # Ticks from each infection to the infection that caused it
+    if parent is None:
+        parent = infection_tree(edges)
+    linked = parent >= 0
+    return edges["tick"][linked] - edges["tick"][parent[linked]]
+
+
+def summarize(edges, before=None, top=10):
+    # Offspring and generation-interval statistics. Infections still
+    # running at the end of the log have had less time to spread, so
+    # `before` limits the offspring numbers to infections before that tick.
+    parent = infection_tree(edges)
+    cases = secondary_cases(edges, parent)
+    intervals = generation_intervals(edges, parent)
+    complete = np.ones(len(edges), dtype=bool) if before is None else edges["tick"] < before
+    counted = cases[complete]
+
+    summary = {
+        "infections": len(edges),
+        "index_cases": int((edges["infector"] < 0).sum()),
+        "counted": len(counted),
+    }
+    if len(counted):
+        mean = counted.mean()
+        variance = counted.var(ddof=1) if len(counted) > 1 else 0.0
+        ranked = np.sort(counted)[::-1]
+        top_fifth = max(1, len(ranked) // 5)
+        summary.update({
+            "mean_secondary": float(mean),
+            "variance_secondary": float(variance),
+            # Negative binomial dispersion; small values mean spread is
+            # concentrated in few superspreaders
+            "dispersion_k": float(mean * mean / (variance - mean)) if variance > mean else np.inf,
+            "no_secondary": float((counted == 0).mean()),
+            "top_20pct_share": float(ranked[:top_fifth].sum() / max(1, ranked.sum())),
+            "offspring_histogram": np.bincount(counted).tolist(),
+        })
+        rows = np.flatnonzero(complete)
+        best = rows[np.argsort(cases[rows], kind="stable")[::-1][:top]]
+        summary["superspreaders"] = [
+            {"agent": int(edges["infectee"][i]), "tick": int(edges["tick"][i]), "cases": int(cases[i])}
+            for i in best if cases[i] > 0
+        ]
+    if len(intervals):
+        summary.update({
+            "mean_generation_interval": float(intervals.mean()),
+            "generation_interval_percentiles": np.percentile(intervals, (5, 25, 50, 75, 95)).tolist(),
+        })
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Statistics of a transmission log")
+    parser.add_argument("path", help=".npy edge list written with engine.py --transmissions")
+    parser.add_argument("--before", type=int, help="only count infections before this tick as spreaders")
+    parser.add_argument("--top", type=int, default=10, help="superspreaders to list")
+    parser.add_argument("--dt", type=float, default=1 / 60, help="seconds per tick")
+    args = parser.parse_args(argv)
+
+    summary = summarize(load_edges(args.path), args.before, args.top)
+    print(f"{summary['infections']} infections, {summary['index_cases']} index cases")
+    if "mean_secondary" in summary:
+        print(f"Secondary cases over {summary['counted']} infections: mean {summary['mean_secondary']:.2f}, "
+              f"variance {summary['variance_secondary']:.2f}, dispersion k {summary['dispersion_k']:.2f}")
+        print(f"{summary['no_secondary']:.0%} infected nobody; the top 20% caused "
+              f"{summary['top_20pct_share']:.0%} of infections")
+        print("Offspring distribution: " + ", ".join(
+            f"{n}: {count}" for n, count in enumerate(summary["offspring_histogram"]) if count))
+        for spreader in summary["superspreaders"]:
+            print(f"  agent {spreader['agent']} infected at tick {spreader['tick']}: {spreader['cases']} cases")
+    if "mean_generation_interval" in summary:
+        p5, p25, p50, p75, p95 = (p * args.dt for p in summary["generation_interval_percentiles"])
+        print(f"Generation interval: mean {summary['mean_generation_interval'] * args.dt:.2f}s, "
+              f"median {p50:.2f}s (5-95%: {p5:.2f}-{p95:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,60 @@
+import argparse
+import os
 import pygame
-import random
-import math
 import sys
+import time
+from collections import OrderedDict
 from datetime import datetime
 
+import numpy as np
+
+from checkpoint import load_checkpoint, save_checkpoint
+from density import DensityGrid
+from engine import Engine, SimulationConfig, positive_int
+from exporter import DROP, MAX_QUEUED_FRAMES, POLICIES, FrameExporter
+from profiling import PhaseTimer, ProfileCapture, format_summary
+from population import INCIDENCE_NAMES, PERSON_SIZE, STATUS_NAMES
+from recorder import StatsRecorder
+from scenario import load_scenario
+from world import BLOCK_SIZE, MAP_SIZES, STREET_WIDTH
+
 # Constants
 WINDOW_WIDTH = 1920
 WINDOW_HEIGHT = 1080
 FPS = 60
+SIM_DT = 1 / FPS  # Simulated time per step, whatever the frame rate
+SPEED_MULTIPLIERS = (1, 10, 100)
+MAX_FRAME_TIME = 0.25  # Longer frames (e.g. a dragged window) count as this
+MAX_STEP_TIME = 1 / 20  # Wall-clock budget for stepping before a frame is drawn
+MAX_SKIPPED_FRAMES = 10  # Always draw at least every this many frames
 UI_PANEL_WIDTH = 300
-
-# Map sizes
-MAP_SIZES = {
-    "Small": (1920, 1080),    # Original size
-    "Medium": (3840, 2160),   # Double size
-    "Large": (5760, 3240)     # Triple size
-}
+CHECKPOINT_PATH = "checkpoint.vsim"  # F5 saves here, F9 loads
+NOTICE_TIME = 3  # Seconds a notice such as "Checkpoint saved" stays up
+PROFILE_FRAMES = 300  # Frames F4 runs cProfile over
+PROFILE_REFRESH = 0.5  # Seconds between updates of the F3 timing overlay
+RECORDINGS_DIR = "recordings"  # F6 records here unless --record says otherwise
+RECORD_FIELDS = ("tick", "time") + STATUS_NAMES + INCIDENCE_NAMES
 
 MIN_ZOOM = 0.5
 MAX_ZOOM = 2.0
 DEFAULT_ZOOM = 1.0
 
+# Pre-rendered city tiles, in screen pixels at the current zoom
+TILE_SIZE = 512
+MAX_CACHED_TILES = 64
+
+# Level of detail for people: full circles up to SPRITE_LIMIT people on
+# screen, single pixels up to HEATMAP_LIMIT, beyond that the density
+# overlay coloured by each cell's infected share
+SPRITE_LIMIT = 20000
+HEATMAP_LIMIT = 200000
+HEATMAP_VIEW = "infected share"
+
+# Density overlay (H) in place of the people: infected per map cell, or the
+# share of each cell's people who have caught the virus
+DENSITY_VIEWS = ("infected", "attack rate")
+DENSITY_ALPHA = 200
+
 # Colors
 BLUE = (0, 0, 255)    # Recovered
 GREEN = (0, 255, 0)   # Healthy
@@ -72,114 +106,253 @@ class Camera:
         world_y = screen_y / self.zoom + self.y
         return world_x, world_y
 
-class Building:
-    def __init__(self, x, y, width, height, type_):
-        self.rect = pygame.Rect(x, y, width, height)
-        self.type = type_
-        self.color = DARK_GRAY if type_ == 'building' else RED if type_ == 'hospital' else BROWN
-        self.label = 'H' if type_ == 'hospital' else 'C' if type_ == 'cemetery' else ''
-
-    def draw(self, screen, font, camera):
-        screen_x, screen_y = camera.world_to_screen(self.rect.x, self.rect.y)
-        screen_width = self.rect.width * camera.zoom
-        screen_height = self.rect.height * camera.zoom
+    def visible_rect(self, screen_width, screen_height, margin=0):
+        # World-space (left, top, right, bottom) of the map view
+        left, top = self.screen_to_world(UI_PANEL_WIDTH, 0)
+        right, bottom = self.screen_to_world(screen_width, screen_height)
+        return left - margin, top - margin, right + margin, bottom + margin
+
+STATUS_COLORS = (GREEN, RED, BLUE, BLACK)  # In STATUS_NAMES order
+BUILDING_COLORS = {'building': DARK_GRAY, 'hospital': RED, 'cemetery': BROWN}
+BUILDING_LABELS = {'hospital': 'H', 'cemetery': 'C'}
+
+class StaticWorldLayer:
+    # Streets, buildings and labels never change during a run, so they are
+    # rendered once per zoom level into tiles and blitted from the cache.
+    # Tiles are made on demand and the least recently used are dropped, so
+    # memory does not grow with the map. Make a new layer when the map is
+    # reset; a zoom change clears the cache by itself.
+    def __init__(self, city, map_width, map_height, font):
+        self.city = city
+        self.map_width = map_width
+        self.map_height = map_height
+        self.font = font
+        self.zoom = None
+        self.tiles = OrderedDict()
+
+    def scaled(self, value):
+        # World to layer pixels, rounded the same way for every tile so
+        # neighbouring tiles line up without seams
+        return int(round(value * self.zoom))
+
+    def render_tile(self, tx, ty):
+        tile = pygame.Surface((TILE_SIZE, TILE_SIZE))
+        tile.fill(WHITE)
+        ox = tx * TILE_SIZE
+        oy = ty * TILE_SIZE
         
-        rect = pygame.Rect(screen_x, screen_y, screen_width, screen_height)
-        pygame.draw.rect(screen, self.color, rect)
+        # World area this tile covers
+        left = ox / self.zoom
+        top = oy / self.zoom
+        right = (ox + TILE_SIZE) / self.zoom
+        bottom = (oy + TILE_SIZE) / self.zoom
         
-        if self.label:
-            text = font.render(self.label, True, WHITE)
-            text_rect = text.get_rect(center=rect.center)
-            screen.blit(text, text_rect)
-
-class Person:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        self.vx = random.uniform(-2, 2)
-        self.vy = random.uniform(-2, 2)
-        self.status = "healthy"
-        self.infection_time = 0
-        self.size = 5
-        self.recovery_time = 10
-        self.death_chance = 0.2
-        self.recovery_chance = 0.8
-        self.infection_radius = 10
-        self.target = None
-        self.target_type = None
-
-    def move(self, buildings, map_width, map_height):
-        if self.status != "dead":
-            if self.target:
-                dx = self.target[0] - self.x
-                dy = self.target[1] - self.y
-                dist = math.sqrt(dx*dx + dy*dy)
-                if dist > 5:
-                    self.vx = dx/dist * 2
-                    self.vy = dy/dist * 2
-                else:
-                    self.target = None
-                    self.target_type = None
-            else:
-                self.vx += random.uniform(-0.2, 0.2)
-                self.vy += random.uniform(-0.2, 0.2)
-                speed = math.sqrt(self.vx*self.vx + self.vy*self.vy)
-                if speed > 2:
-                    self.vx = self.vx/speed * 2
-                    self.vy = self.vy/speed * 2
-
-            self.x += self.vx
-            self.y += self.vy
-
-            # Keep within map bounds
-            self.x = max(0, min(map_width, self.x))
-            self.y = max(0, min(map_height, self.y))
-
-            # Avoid buildings
-            for building in buildings:
-                if building.rect.collidepoint(self.x, self.y):
-                    if self.x < building.rect.left:
-                        self.x = building.rect.left - 1
-                    elif self.x > building.rect.right:
-                        self.x = building.rect.right + 1
-                    if self.y < building.rect.top:
-                        self.y = building.rect.top - 1
-                    elif self.y > building.rect.bottom:
-                        self.y = building.rect.bottom + 1
-
-    def update(self, dt, people, buildings):
-        if self.status == "infected":
-            self.infection_time += dt
-            
-            # Infected people try to go to hospital
-            if not self.target and random.random() < 0.01:
-                for building in buildings:
-                    if building.type == 'hospital':
-                        self.target = (building.rect.centerx, building.rect.centery)
-                        self.target_type = 'hospital'
-                        break
-            
-            if self.infection_time >= self.recovery_time:
-                if random.random() < self.death_chance:
-                    self.status = "dead"
-                else:
-                    if random.random() < self.recovery_chance:
-                        self.status = "recovered"
-                    else:
-                        self.status = "healthy"
-                    self.infection_time = 0
-            
-            # Try to infect others
-            for person in people:
-                if person.status == "healthy":
-                    distance = math.sqrt((self.x - person.x)**2 + (self.y - person.y)**2)
-                    if distance < self.infection_radius and random.random() < 0.4:
-                        person.status = "infected"
+        def draw_rect(color, x, y, width, height):
+            rect = pygame.Rect(self.scaled(x) - ox, self.scaled(y) - oy,
+                               self.scaled(x + width) - self.scaled(x),
+                               self.scaled(y + height) - self.scaled(y))
+            pygame.draw.rect(tile, color, rect)
+            return rect
+        
+        # Streets
+        for x in range(0, self.map_width, BLOCK_SIZE):
+            if x < right and x + STREET_WIDTH > left:
+                draw_rect(LIGHT_GRAY, x, 0, STREET_WIDTH, self.map_height)
+        for y in range(0, self.map_height, BLOCK_SIZE):
+            if y < bottom and y + STREET_WIDTH > top:
+                draw_rect(LIGHT_GRAY, 0, y, self.map_width, STREET_WIDTH)
+        
+        # Buildings and their labels
+        for building in self.city.buildings_in(left, top, right, bottom):
+            rect = draw_rect(BUILDING_COLORS[building.type], building.x, building.y,
+                             building.width, building.height)
+            label = BUILDING_LABELS.get(building.type)
+            if label:
+                text = self.font.render(label, True, WHITE)
+                tile.blit(text, text.get_rect(center=rect.center))
+        return tile
 
     def draw(self, screen, camera):
-        color = GREEN if self.status == "healthy" else RED if self.status == "infected" else BLACK if self.status == "dead" else BLUE
-        screen_x, screen_y = camera.world_to_screen(self.x, self.y)
-        pygame.draw.circle(screen, color, (int(screen_x), int(screen_y)), int(self.size * camera.zoom))
+        if camera.zoom != self.zoom:
+            self.zoom = camera.zoom
+            self.tiles.clear()
+        
+        # Layer pixel shown at the left edge of the map view
+        view_x = self.scaled(camera.x)
+        view_y = self.scaled(camera.y)
+        view_width = screen.get_width() - UI_PANEL_WIDTH
+        view_height = screen.get_height()
+        
+        first_tx = max(0, view_x // TILE_SIZE)
+        first_ty = max(0, view_y // TILE_SIZE)
+        last_tx = min((view_x + view_width) // TILE_SIZE, self.scaled(self.map_width) // TILE_SIZE)
+        last_ty = min((view_y + view_height) // TILE_SIZE, self.scaled(self.map_height) // TILE_SIZE)
+        for tx in range(first_tx, last_tx + 1):
+            for ty in range(first_ty, last_ty + 1):
+                tile = self.tiles.get((tx, ty))
+                if tile is None:
+                    tile = self.render_tile(tx, ty)
+                    self.tiles[(tx, ty)] = tile
+                    if len(self.tiles) > MAX_CACHED_TILES:
+                        self.tiles.popitem(last=False)
+                else:
+                    self.tiles.move_to_end((tx, ty))
+                screen.blit(tile, (tx * TILE_SIZE - view_x + UI_PANEL_WIDTH, ty * TILE_SIZE - view_y))
+
+class AgentRenderer:
+    # Draws all visible people in a few batched calls instead of one
+    # draw.circle per person. Small discs and single pixels are stamped
+    # straight into the screen's pixel array; larger ones are blitted in
+    # one blits() call from sprites made once per colour and zoom level.
+    # Returns False without drawing when more than HEATMAP_LIMIT people are
+    # in view, for the caller to show their density instead.
+    COLOR_KEY = (255, 0, 255)
+    STAMP_MAX_RADIUS = 2
+    DRAW_ORDER = (3, 2, 0, 1)  # Dead, recovered, healthy, then infected on top
+
+    def __init__(self):
+        self.discs = {}
+        self.sprites = {}
+
+    def disc(self, radius):
+        if radius not in self.discs:
+            r = np.arange(-radius, radius + 1)
+            dx, dy = np.meshgrid(r, r)
+            inside = dx*dx + dy*dy <= radius*radius
+            self.discs[radius] = (dx[inside].astype(np.int32), dy[inside].astype(np.int32))
+        return self.discs[radius]
+
+    def sprite(self, status, radius):
+        key = (status, radius)
+        if key not in self.sprites:
+            sprite = pygame.Surface((2 * radius + 1, 2 * radius + 1))
+            sprite.fill(self.COLOR_KEY)
+            sprite.set_colorkey(self.COLOR_KEY)
+            pygame.draw.circle(sprite, STATUS_COLORS[status], (radius, radius), radius)
+            self.sprites[key] = sprite
+        return self.sprites[key]
+
+    def draw(self, screen, camera, population):
+        width, height = screen.get_size()
+        left, top, right, bottom = camera.visible_rect(width, height, margin=PERSON_SIZE)
+        x = population.x
+        y = population.y
+        visible = np.flatnonzero((x >= left) & (x <= right) & (y >= top) & (y <= bottom))
+        if len(visible) == 0:
+            return True
+        if len(visible) > HEATMAP_LIMIT:
+            return False
+        
+        sx = ((x[visible] - camera.x) * camera.zoom + UI_PANEL_WIDTH).astype(np.int32)
+        sy = ((y[visible] - camera.y) * camera.zoom).astype(np.int32)
+        status = population.status[visible]
+        radius = int(PERSON_SIZE * camera.zoom) if len(visible) <= SPRITE_LIMIT else 0
+        # 24-bit surfaces have no 2D pixel view, so they always use sprites
+        if radius > self.STAMP_MAX_RADIUS or screen.get_bitsize() not in (8, 16, 32):
+            for code in self.DRAW_ORDER:
+                group = status == code
+                if group.any():
+                    r = max(radius, 1)
+                    sprite = self.sprite(code, r)
+                    corner = zip((sx[group] - r).tolist(), (sy[group] - r).tolist())
+                    screen.blits([(sprite, pos) for pos in corner], doreturn=False)
+            return True
+        
+        dx, dy = self.disc(radius)
+        pixels = pygame.surfarray.pixels2d(screen)
+        try:
+            for code in self.DRAW_ORDER:
+                group = status == code
+                if not group.any():
+                    continue
+                px = (sx[group, None] + dx).ravel()
+                py = (sy[group, None] + dy).ravel()
+                ok = (px >= UI_PANEL_WIDTH) & (px < width) & (py >= 0) & (py < height)
+                pixels[px[ok], py[ok]] = screen.map_rgb(STATUS_COLORS[code])
+        finally:
+            del pixels
+        return True
+
+def share_colors(share):
+    # (..., 3) colours from green at 0 to red at 1
+    share = share[..., None]
+    return np.array(GREEN) * (1 - share) + np.array(RED) * share
+
+class DensityOverlay:
+    # Draws a density.DensityGrid over the map as one flat square per cell,
+    # for one of DENSITY_VIEWS or HEATMAP_VIEW. The cell image is only
+    # remade when the grid has new data, and scaled to the view only when
+    # that or the camera changes; other frames blit the cached surface,
+    # whatever the number of people.
+    def __init__(self):
+        self.cells = None
+        self.cells_key = None
+        self.view = None
+        self.view_key = None
+        self.view_pos = (0, 0)
+        self.legend = ""
+
+    def render_cells(self, grid, mode):
+        total = grid.total()
+        if mode == "infected":
+            infected = grid.layer("infected")
+            peak = max(int(infected.max()), 1)
+            level = infected / peak
+            # Red, more opaque the more infected; cells with nobody
+            # infected stay clear
+            rgb = np.broadcast_to(np.array(RED), level.shape + (3,))
+            alpha = np.where(infected > 0, 60 + (DENSITY_ALPHA - 60) * level, 0)
+            (x, y), count = grid.hotspot()
+            self.legend = (f"Infected per cell: up to {peak}, most at ({x:.0f}, {y:.0f})" if count
+                           else "Infected per cell: none")
+        elif mode == HEATMAP_VIEW:
+            # Green to red by infected share, fading out in cells with fewer
+            # people than the average occupied cell
+            rgb = share_colors(grid.infected_share())
+            busy = total[total > 0].mean() if total.any() else 1
+            alpha = DENSITY_ALPHA * np.minimum(total / busy, 1)
+            self.legend = "Too many people to draw: infected share per cell, green 0% to red 100%"
+        else:
+            rgb = share_colors(grid.attack_rate())
+            alpha = np.where(total > 0, DENSITY_ALPHA, 0)
+            people = max(int(total.sum()), 1)
+            self.legend = (f"Attack rate per cell: {int((total - grid.layer('healthy')).sum()) / people:.0%} "
+                           f"overall, green 0% to red 100%")
+
+        surface = pygame.Surface((grid.cols, grid.rows), pygame.SRCALPHA)
+        # Surface arrays are indexed (x, y); the grid is (row, col)
+        pixels = pygame.surfarray.pixels3d(surface)
+        pixels[...] = rgb.astype(np.uint8).transpose(1, 0, 2)
+        del pixels
+        alphas = pygame.surfarray.pixels_alpha(surface)
+        alphas[...] = alpha.astype(np.uint8).T
+        del alphas
+        return surface
+
+    def draw(self, screen, camera, grid, mode, font):
+        key = (id(grid), grid.version, mode)
+        if key != self.cells_key:
+            self.cells = self.render_cells(grid, mode)
+            self.cells_key = key
+        width, height = screen.get_size()
+        view_key = (key, camera.x, camera.y, camera.zoom, width, height)
+        if view_key != self.view_key:
+            # Scale only the cells in view
+            left, top, right, bottom = camera.visible_rect(width, height)
+            size = grid.cell_size
+            c0 = int(np.clip(left // size, 0, grid.cols - 1))
+            r0 = int(np.clip(top // size, 0, grid.rows - 1))
+            c1 = int(np.clip(-(-right // size), c0 + 1, grid.cols))
+            r1 = int(np.clip(-(-bottom // size), r0 + 1, grid.rows))
+            part = self.cells.subsurface((c0, r0, c1 - c0, r1 - r0))
+            scaled = (max(1, round((c1 - c0) * size * camera.zoom)), max(1, round((r1 - r0) * size * camera.zoom)))
+            self.view = pygame.transform.scale(part, scaled)
+            self.view_pos = tuple(round(v) for v in camera.world_to_screen(c0 * size, r0 * size))
+            self.view_key = view_key
+        screen.blit(self.view, self.view_pos)
+        text = font.render(self.legend, True, BLACK)
+        screen.blit(text, (width - text.get_width() - 10, 10))
+
 
 class Slider:
     def __init__(self, x, y, width, min_val, max_val, initial_val, label):
@@ -216,6 +389,12 @@ class Slider:
             return True
         return False
 
+    def set_value(self, value):
+        self.value = value
+        fraction = (value - self.min_val) / (self.max_val - self.min_val)
+        fraction = max(0, min(fraction, 1))
+        self.handle_rect.x = self.rect.x + (self.rect.width - 10) * fraction
+
 class Button:
     def __init__(self, x, y, width, height, text, color=GREEN):
         self.rect = pygame.Rect(x, y, width, height)
@@ -288,38 +467,84 @@ class Dropdown:
         return False
 
 class Simulation:
-    def __init__(self):
-        pygame.init()
+    def __init__(self, stats_path=None, checkpoint_path=CHECKPOINT_PATH, resume_path=None,
+                 record_path=None, record_every=1, record_queue=MAX_QUEUED_FRAMES, record_policy=DROP,
+                 scenario=None):
+        # Only what the window needs; audio and the other subsystems
+        # pygame.init() would start are never used
+        pygame.display.init()
+        pygame.font.init()
         self.screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT), pygame.FULLSCREEN)
         pygame.display.set_caption("Virus Spread Simulation")
         self.clock = pygame.time.Clock()
         self.running = True
         self.paused = True
         self.simulation_running = False
-        
-        # Time tracking
-        self.time = 0
+        self.speed = SPEED_MULTIPLIERS[0]
+        self.accumulator = 0
         
         # Fonts
         self.font = pygame.font.Font(None, 36)
         self.small_font = pygame.font.Font(None, 24)
         self.title_font = pygame.font.Font(None, 72)
         
-        # Show map size selection screen
-        self.show_map_selection()
+        # Show map size selection screen, unless the map comes from a
+        # checkpoint or a scenario (a SimulationConfig)
+        self.map_size = "Small"
+        self.seed = None
+        if scenario is not None:
+            self.map_size = scenario.map_size
+            self.seed = scenario.seed
+        elif resume_path is None:
+            self.show_map_selection()
         
         # Camera
         self.camera = Camera()
         
-        # Buildings
-        self.buildings = []
-        self.create_city_layout()
-        
-        # People
-        self.people = []
-        
         # Create UI elements
         self.create_ui_elements()
+        if scenario is not None:
+            self.set_sliders(scenario, scenario.population)
+        
+        # Per-phase frame timings, off until F3
+        self.profiler = PhaseTimer(enabled=False)
+        self.profile_capture = ProfileCapture()
+        self.profile_font = pygame.font.SysFont("consolas,dejavusansmono,couriernew,monospace", 18)
+        self.profile_overlay = None
+        self.profile_overlay_time = 0
+        
+        # The model (city layout and people) lives in a headless engine
+        self.engine = Engine(self.config_from_sliders())
+        self.engine.timer = self.profiler
+        self.world_layer = self.create_world_layer()
+        self.agent_renderer = AgentRenderer()
+        self.density_overlay = DensityOverlay()
+        self.density_view = None
+        self.crowd_grid = None
+        self.crowd_key = (None, None)
+        
+        # Per-tick counts, also what the stats panel shows
+        self.recorder = StatsRecorder(stats_path)
+        
+        self.checkpoint_path = checkpoint_path
+        self.notice = None
+        self.notice_time = 0
+        if resume_path is not None:
+            self.load_checkpoint(resume_path)
+        
+        # Frame and metrics recording, written by a background thread
+        self.record_path = record_path
+        self.record_every = max(1, record_every)
+        self.record_queue = record_queue
+        self.record_policy = record_policy
+        self.exporter = None
+        self.frame_count = 0
+        if record_path is not None:
+            self.start_recording()
+        
+        # A scenario goes straight into its run
+        if scenario is not None and resume_path is None:
+            self.start_simulation()
 
     def show_map_selection(self):
         selected = False
@@ -356,31 +581,10 @@ class Simulation:
                         rect = pygame.Rect(WINDOW_WIDTH//2 - 200, y, 400, 80)
                         if rect.collidepoint(event.pos):
                             self.map_size = size
-                            self.MAP_WIDTH, self.MAP_HEIGHT = MAP_SIZES[size]
                             selected = True
                             break
                         y += 100
 
-    def create_city_layout(self):
-        # Create streets
-        street_width = 100
-        for x in range(0, self.MAP_WIDTH, 300):
-            pygame.draw.rect(self.screen, LIGHT_GRAY, (x, 0, street_width, self.MAP_HEIGHT))
-        for y in range(0, self.MAP_HEIGHT, 300):
-            pygame.draw.rect(self.screen, LIGHT_GRAY, (0, y, self.MAP_WIDTH, street_width))
-        
-        # Create buildings
-        for x in range(100, self.MAP_WIDTH - 100, 300):
-            for y in range(100, self.MAP_HEIGHT - 100, 300):
-                if random.random() < 0.8:
-                    self.buildings.append(Building(x, y, 100, 100, 'building'))
-        
-        # Create hospital
-        self.buildings.append(Building(self.MAP_WIDTH - 200, 100, 150, 150, 'hospital'))
-        
-        # Create cemetery
-        self.buildings.append(Building(100, self.MAP_HEIGHT - 200, 150, 150, 'cemetery'))
-
     def create_ui_elements(self):
         # Sliders
         self.sliders = [
@@ -409,9 +613,32 @@ class Simulation:
                     self.running = False
                 elif event.key == pygame.K_SPACE:
                     self.paused = not self.paused
+                elif event.key == pygame.K_f:
+                    i = SPEED_MULTIPLIERS.index(self.speed)
+                    self.speed = SPEED_MULTIPLIERS[(i + 1) % len(SPEED_MULTIPLIERS)]
                 elif event.key == pygame.K_m:
                     self.show_map_selection()
                     self.reset_simulation()
+                elif event.key == pygame.K_F3:
+                    self.profiler.enabled = not self.profiler.enabled
+                    self.profiler.reset()
+                    self.profile_overlay = None
+                elif event.key == pygame.K_F4:
+                    self.start_profile_capture()
+                elif event.key == pygame.K_F5:
+                    self.save_checkpoint()
+                elif event.key == pygame.K_F6:
+                    if self.exporter is None:
+                        self.start_recording()
+                    else:
+                        self.stop_recording()
+                elif event.key == pygame.K_F9:
+                    self.load_checkpoint(self.checkpoint_path)
+                elif event.key == pygame.K_h:
+                    views = (None,) + DENSITY_VIEWS
+                    self.density_view = views[(views.index(self.density_view) + 1) % len(views)]
+                    self.attach_density()
+                    self.show_notice(f"Density overlay: {self.density_view or 'off'}")
             
             # Handle camera events
             self.camera.handle_event(event)
@@ -427,30 +654,159 @@ class Simulation:
                     elif button.text == "Reset":
                         self.reset_simulation()
 
+    def create_world_layer(self):
+        return StaticWorldLayer(self.engine.city, self.engine.map_width,
+                                self.engine.map_height, self.font)
+
+    def config_from_sliders(self):
+        return SimulationConfig(
+            population=int(self.sliders[0].value),
+            initial_infected_pct=self.sliders[1].value,
+            infection_radius=self.sliders[2].value,
+            infection_chance_pct=self.sliders[3].value,
+            death_chance_pct=self.sliders[4].value,
+            recovery_chance_pct=self.sliders[5].value,
+            recovery_time=self.sliders[6].value,
+            movement_speed=self.sliders[7].value,
+            map_size=self.map_size,
+            seed=self.seed
+        )
+
+    def set_sliders(self, config, population):
+        values = [population, config.initial_infected_pct, config.infection_radius,
+                  config.infection_chance_pct, config.death_chance_pct, config.recovery_chance_pct,
+                  config.recovery_time, config.movement_speed]
+        for slider, value in zip(self.sliders, values):
+            slider.set_value(value)
+
     def start_simulation(self):
         self.simulation_running = True
         self.paused = False
         
-        num_people = int(self.sliders[0].value)
-        num_infected = int(num_people * self.sliders[1].value / 100)
-        
-        for _ in range(num_people):
-            x = random.randint(UI_PANEL_WIDTH, self.MAP_WIDTH - 100)
-            y = random.randint(0, self.MAP_HEIGHT - 100)
-            person = Person(x, y)
-            
-            if num_infected > 0:
-                person.status = "infected"
-                num_infected -= 1
-            
-            person.infection_radius = self.sliders[2].value
-            person.death_chance = self.sliders[4].value / 100
-            person.recovery_chance = self.sliders[5].value / 100
-            person.recovery_time = self.sliders[6].value
-            person.vx = random.uniform(-self.sliders[7].value, self.sliders[7].value)
-            person.vy = random.uniform(-self.sliders[7].value, self.sliders[7].value)
-            
-            self.people.append(person)
+        self.engine.config = self.config_from_sliders()
+        self.engine.start()
+        self.recorder.reset()
+        self.update_stats()
+
+    def save_checkpoint(self):
+        if not self.simulation_running:
+            self.show_notice("Start a simulation before saving")
+            return
+        try:
+            save_checkpoint(self.engine, self.checkpoint_path)
+        except OSError as e:
+            self.show_notice(f"Could not save checkpoint: {e}")
+            return
+        self.show_notice(f"Saved {self.checkpoint_path} at {self.engine.time:.1f}s")
+
+    def load_checkpoint(self, path):
+        try:
+            engine = load_checkpoint(path)
+        except (OSError, ValueError) as e:
+            self.show_notice(f"Could not load checkpoint: {e}")
+            return
+        self.engine = engine
+        self.engine.timer = self.profiler
+        self.attach_density()
+        self.map_size = engine.config.map_size
+        self.seed = engine.config.seed
+        self.set_sliders(engine.config, len(engine.population))
+        self.world_layer = self.create_world_layer()
+        self.recorder.reset()
+        self.update_stats()
+        # Resumed paused, so the loaded state can be looked at first
+        self.simulation_running = True
+        self.paused = True
+        self.accumulator = 0
+        self.show_notice(f"Loaded {path} at {engine.time:.1f}s")
+
+    def show_notice(self, text):
+        self.notice = text
+        self.notice_time = time.perf_counter()
+
+    def draw_notice(self):
+        if self.notice is None or time.perf_counter() - self.notice_time > NOTICE_TIME:
+            return
+        text = self.small_font.render(self.notice, True, BLACK)
+        pygame.draw.rect(self.screen, WHITE, (UI_PANEL_WIDTH + 10, WINDOW_HEIGHT - 40,
+                                              text.get_width() + 20, 30))
+        self.screen.blit(text, (UI_PANEL_WIDTH + 20, WINDOW_HEIGHT - 33))
+
+    def start_recording(self):
+        path = self.record_path or os.path.join(RECORDINGS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}")
+        try:
+            self.exporter = FrameExporter(path, self.screen.get_width(), self.screen.get_height(),
+                                          RECORD_FIELDS, fps=FPS / self.record_every,
+                                          max_queued=self.record_queue, policy=self.record_policy)
+        except OSError as e:
+            self.show_notice(f"Can't record: {e}")
+            return
+        self.show_notice(f"Recording to {path}")
+
+    def stop_recording(self):
+        exporter = self.exporter
+        self.exporter = None
+        try:
+            exporter.close()
+        except Exception as e:
+            self.show_notice(f"Recording failed: {e}")
+            return
+        self.show_notice(f"Saved {exporter.written} frames to {exporter.path} ({exporter.dropped} dropped)")
+
+    def record_frame(self):
+        # Only a copy of the screen is made here; encoding and writing
+        # happen on the exporter's thread
+        if self.exporter is None:
+            return
+        self.frame_count += 1
+        if self.frame_count % self.record_every:
+            return
+        population = self.engine.population
+        row = (self.engine.ticks, round(self.engine.time, 6), *population.counts().tolist(),
+               *population.incidence())
+        self.exporter.capture(lambda: pygame.image.tobytes(self.screen, "RGB"), row)
+
+    def draw_recording(self):
+        if self.exporter is None:
+            return
+        label = f"REC {self.exporter.written} frames"
+        if self.exporter.dropped:
+            label += f", {self.exporter.dropped} dropped"
+        text = self.small_font.render(label, True, RED)
+        self.screen.blit(text, (UI_PANEL_WIDTH + 10, 10))
+
+    def start_profile_capture(self):
+        if self.profile_capture.active:
+            return
+        path = f"profile-{datetime.now():%Y%m%d-%H%M%S}.prof"
+        self.profile_capture.start(PROFILE_FRAMES, path)
+        self.show_notice(f"Profiling {PROFILE_FRAMES} frames...")
+
+    def finish_profile_frame(self):
+        report = self.profile_capture.frame_done()
+        if report is not None:
+            print(report)
+            self.show_notice(f"Saved {self.profile_capture.path}")
+
+    def draw_profiler(self):
+        if not self.profiler.enabled:
+            return
+        # Re-rendering the text every frame would show up in the timings
+        # it displays, so the overlay is refreshed a few times a second
+        now = time.perf_counter()
+        if self.profile_overlay is None or now - self.profile_overlay_time > PROFILE_REFRESH:
+            lines = [f"FPS {self.clock.get_fps():.0f}"] + format_summary(self.profiler.summary())
+            surfaces = [self.profile_font.render(line, True, WHITE) for line in lines]
+            width = max(s.get_width() for s in surfaces) + 20
+            height = sum(s.get_height() for s in surfaces) + 20
+            self.profile_overlay = pygame.Surface((width, height), pygame.SRCALPHA)
+            self.profile_overlay.fill((0, 0, 0, 180))
+            y = 10
+            for surface in surfaces:
+                self.profile_overlay.blit(surface, (10, y))
+                y += surface.get_height()
+            self.profile_overlay_time = now
+        self.screen.blit(self.profile_overlay, (self.screen.get_width() - self.profile_overlay.get_width() - 10, 10))
 
     def draw_ui(self):
         # Draw UI panel background
@@ -462,7 +818,7 @@ class Simulation:
         self.screen.blit(title, (UI_PANEL_WIDTH//2 - title.get_width()//2, 20))
         
         # Draw map size info
-        map_text = self.small_font.render(f"Map: {self.map_size}", True, BLACK)
+        map_text = self.small_font.render(f"Map: {self.map_size}    Speed: {self.speed}x", True, BLACK)
         self.screen.blit(map_text, (20, 50))
         
         # Draw sliders
@@ -475,12 +831,19 @@ class Simulation:
         
         # Draw stats
         stats_y = 700
+        latest = self.recorder.latest()
+        counts = {name: latest[name] if latest is not None else 0 for name in STATUS_NAMES}
         stats = [
-            f"Healthy: {sum(1 for p in self.people if p.status == 'healthy')}",
-            f"Infected: {sum(1 for p in self.people if p.status == 'infected')}",
-            f"Recovered: {sum(1 for p in self.people if p.status == 'recovered')}",
-            f"Dead: {sum(1 for p in self.people if p.status == 'dead')}",
-            f"Total: {len(self.people)}"
+            f"Healthy: {counts['healthy']}",
+            f"Infected: {counts['infected']}",
+            f"Recovered: {counts['recovered']}",
+            f"Dead: {counts['dead']}",
+            f"Total: {len(self.engine.population)}"
+        ]
+        r_t = self.recorder.reproduction_number(self.engine.config.recovery_time)
+        incidence = [
+            f"New infections: {latest['new_infections'] if latest is not None else 0}",
+            f"R(t): {r_t:.2f}" if r_t is not None else "R(t): -"
         ]
         
         colors = [GREEN, RED, BLUE, BLACK, BLACK]
@@ -488,68 +851,171 @@ class Simulation:
             pygame.draw.rect(self.screen, color, (20, stats_y + i * 30, 15, 15))
             text = self.small_font.render(stat, True, BLACK)
             self.screen.blit(text, (40, stats_y + i * 30))
+        for i, line in enumerate(incidence):
+            text = self.small_font.render(line, True, BLACK)
+            self.screen.blit(text, (20, stats_y + 150 + i * 25))
         
         # Draw controls info
         controls = [
             "Controls:",
             "Space: Pause/Resume",
+            "F: Speed 1x/10x/100x",
             "M: Change Map Size",
+            "F3/F4: Timings/cProfile",
+            "F5/F9: Save/Load Checkpoint",
+            "F6/H: Record/Density Map",
             "ESC: Exit"
         ]
         for i, control in enumerate(controls):
             text = self.small_font.render(control, True, BLACK)
             self.screen.blit(text, (20, stats_y + 200 + i * 25))
 
+    def draw_people(self):
+        # Only people inside the map view are drawn, or their cell counts
+        # while the density overlay is on or too many are in view
+        if self.density_view is not None and self.engine.density is not None:
+            self.density_overlay.draw(self.screen, self.camera, self.engine.density,
+                                      self.density_view, self.small_font)
+        elif not self.agent_renderer.draw(self.screen, self.camera, self.engine.population):
+            self.density_overlay.draw(self.screen, self.camera, self.crowd_density(),
+                                      HEATMAP_VIEW, self.small_font)
+
+    def crowd_density(self):
+        # Cell counts for a zoomed-out view of a big crowd, binned at most
+        # once per tick and kept apart from the engine's own density grid
+        engine = self.engine
+        source = (id(engine.population), engine.map_width, engine.map_height)
+        if self.crowd_grid is None or self.crowd_key[0] != source:
+            self.crowd_grid = DensityGrid(engine.map_width, engine.map_height)
+            self.crowd_key = (None, None)
+        if self.crowd_key != (source, engine.ticks):
+            self.crowd_grid.update(engine.population, engine.ticks)
+            self.crowd_key = (source, engine.ticks)
+        return self.crowd_grid
+
+    def attach_density(self):
+        # The engine bins people into cells every tick while the overlay is on
+        if self.density_view is None:
+            self.engine.density = None
+        elif self.engine.density is None:
+            self.engine.density = DensityGrid(self.engine.map_width, self.engine.map_height)
+            self.engine.density.update(self.engine.population, self.engine.ticks)
+
     def update_stats(self):
-        # This method is called in the run loop but doesn't need to do anything
-        # since we're displaying stats directly in draw_ui
-        pass
+        # The population keeps live counters, so recording a tick is O(1);
+        # the stats panel reads the latest row
+        population = self.engine.population
+        self.recorder.record(self.engine.ticks, self.engine.time, population.counts(),
+                             population.incidence())
 
     def reset_simulation(self):
-        self.people = []
-        self.buildings = []
-        self.create_city_layout()
+        self.engine = Engine(self.config_from_sliders())
+        self.engine.timer = self.profiler
+        self.attach_density()
+        self.world_layer = self.create_world_layer()
+        self.recorder.reset()
         self.simulation_running = False
         self.paused = True
-        self.time = 0
+        self.accumulator = 0
         self.camera.x = 0
         self.camera.y = 0
         self.camera.zoom = DEFAULT_ZOOM
 
+    def step_simulation(self, frame_time):
+        # Fixed-timestep accumulator: the model always advances in SIM_DT
+        # steps, as many per frame as the speed multiplier asks for.
+        # Returns True when it ran out of time with steps still owed.
+        self.accumulator += min(frame_time, MAX_FRAME_TIME) * self.speed
+        deadline = time.perf_counter() + MAX_STEP_TIME
+        while self.accumulator >= SIM_DT:
+            self.engine.step(SIM_DT)
+            self.update_stats()
+            self.accumulator -= SIM_DT
+            if time.perf_counter() > deadline:
+                break
+        # Never owe more than a second of wall-clock time, or a speed the
+        # machine can't reach would leave the run stepping forever
+        self.accumulator = min(self.accumulator, self.speed)
+        return self.accumulator >= SIM_DT
+
     def run(self):
+        skipped_frames = 0
+        previous = time.perf_counter()
+        profiler = self.profiler
         while self.running:
-            dt = 1/FPS
-            self.handle_events()
+            with profiler.phase("events"):
+                self.handle_events()
+            
+            now = time.perf_counter()
+            frame_time = now - previous
+            previous = now
+            
+            if not self.paused and self.simulation_running:
+                with profiler.phase("simulate"):
+                    behind = self.step_simulation(frame_time)
+                # When falling behind, skip drawing rather than sim steps
+                if behind and skipped_frames < MAX_SKIPPED_FRAMES:
+                    skipped_frames += 1
+                    self.finish_profile_frame()
+                    continue
+            skipped_frames = 0
             
             # Draw everything
             self.screen.fill(WHITE)
             
-            # Draw buildings
-            for building in self.buildings:
-                building.draw(self.screen, self.font, self.camera)
+            # Draw the cached streets and buildings
+            with profiler.phase("draw_world"):
+                self.world_layer.draw(self.screen, self.camera)
             
-            if not self.paused and self.simulation_running:
-                self.time += dt
-                
-                # Update all people
-                for person in self.people:
-                    person.move(self.buildings, self.MAP_WIDTH, self.MAP_HEIGHT)
-                    person.update(dt, self.people, self.buildings)
-                
-                self.update_stats()
-            
-            # Draw people
-            for person in self.people:
-                person.draw(self.screen, self.camera)
+            with profiler.phase("draw_people"):
+                self.draw_people()
             
-            self.draw_ui()
+            with profiler.phase("draw_ui"):
+                self.draw_ui()
+            with profiler.phase("record"):
+                self.record_frame()
+            # Overlays only for whoever is watching, never in recordings
+            self.draw_notice()
+            self.draw_recording()
+            self.draw_profiler()
             
-            pygame.display.flip()
+            with profiler.phase("flip"):
+                pygame.display.flip()
+            self.finish_profile_frame()
             self.clock.tick(FPS)
         
+        if self.exporter is not None:
+            self.stop_recording()
+        self.recorder.close()
         pygame.quit()
         sys.exit()
 
 if __name__ == "__main__":
-    simulation = Simulation()
+    parser = argparse.ArgumentParser(description="Virus Spread Simulation")
+    parser.add_argument("--stats-out", help="stream per-tick status counts to this .npy file")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="file F5 saves to and F9 loads from")
+    parser.add_argument("--resume", metavar="PATH", help="start from a checkpoint instead of a new run")
+    parser.add_argument("--scenario", metavar="PATH",
+                        help="start a run with the settings in this .toml or .json file, skipping the map picker")
+    parser.add_argument("--record", metavar="PATH",
+                        help="record from the start: a directory for PNG frames, or a video file "
+                             "(.mp4, .mkv, ...) encoded by ffmpeg; F6 toggles it")
+    parser.add_argument("--record-every", type=positive_int, default=1, help="keep one frame in this many")
+    parser.add_argument("--record-queue", type=positive_int, default=MAX_QUEUED_FRAMES,
+                        help="frames waiting to be written before the policy applies")
+    parser.add_argument("--record-policy", choices=POLICIES, default=DROP,
+                        help="when the writer falls behind: drop new frames, or block until it catches up")
+    args = parser.parse_args()
+    scenario = None
+    if args.scenario:
+        if args.resume:
+            parser.error("--scenario starts a new run and can't be used with --resume")
+        try:
+            scenario = load_scenario(args.scenario)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    simulation = Simulation(stats_path=args.stats_out, checkpoint_path=args.checkpoint,
+                            resume_path=args.resume, record_path=args.record,
+                            record_every=args.record_every, record_queue=args.record_queue,
+                            record_policy=args.record_policy, scenario=scenario)
     simulation.run() 
\ No newline at end of file
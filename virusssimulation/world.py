@@ -0,0 +1,502 @@
+import math
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+# Map sizes
+MAP_SIZES = {
+    "Small": (1920, 1080),    # Original size
+    "Medium": (3840, 2160),   # Double size
+    "Large": (5760, 3240),    # Triple size
+    "Huge": (19200, 10800),   # 10x Small each way
+    "Giant": (57600, 32400)   # 10x Large each way
+}
+
+BLOCK_SIZE = 300
+STREET_WIDTH = 100
+BUILDING_SIZE = 100
+BUILDING_CHANCE = 0.8
+BUILDING_TYPES = ("building", "hospital", "cemetery")
+
+# Upper bound on the occupancy raster, in cells
+MAX_INDEX_CELLS = 16_000_000
+
+# Navigation fields: cell size in pixels, and the neighbour steps tried
+# when picking each cell's direction, straight ones first
+NAV_CELL_SIZE = 25
+NAV_STEPS = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+
+# Maps up to the Large size keep every building in one flat list; bigger
+# ones are generated procedurally, a chunk at a time
+MAX_FLAT_AREA = 5760 * 3240
+DESTINATION_SIZE = 150
+LOTS_PER_CHUNK = 8  # Chunks are 8x8 lots, 2400 px square
+MAX_CACHED_CHUNKS = 256
+DISTRICT_LOTS = 16  # Districts are 16x16 lots, 4800 px square
+DISTRICT_DENSITIES = (0.15, 0.45, 0.8, 0.95)  # Parks, suburbs, city, downtown
+HOSPITAL_CHANCE = 0.3  # Per district
+CEMETERY_CHANCE = 0.15
+CHUNKED_NAV_CELL_SIZE = 50
+# Seed streams, so every part of the generator draws independently of
+# the order chunks happen to be made in
+DISTRICT_STREAM = 0
+DESTINATION_STREAM = 1
+CHUNK_STREAM = 2
+
+# Side of the building on a lot, by lot code (-1 is an empty lot)
+LOT_SIZES = np.array([0, BUILDING_SIZE, DESTINATION_SIZE, DESTINATION_SIZE], dtype=np.float64)
+
+
+class Building:
+    def __init__(self, x, y, width, height, type_):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.type = type_
+
+    @property
+    def left(self):
+        return self.x
+
+    @property
+    def top(self):
+        return self.y
+
+    @property
+    def right(self):
+        return self.x + self.width
+
+    @property
+    def bottom(self):
+        return self.y + self.height
+
+    @property
+    def centerx(self):
+        return self.x + self.width // 2
+
+    @property
+    def centery(self):
+        return self.y + self.height // 2
+
+    @property
+    def rect(self):
+        return (self.x, self.y, self.width, self.height)
+
+    def contains(self, x, y):
+        return self.left <= x < self.right and self.top <= y < self.bottom
+
+
+class CityIndex(ABC):
+    # What the model needs from a city, whichever way its buildings are
+    # stored. Building ids come from lookup() and are only meaningful to
+    # the city that returned them.
+    nav_cell_size = NAV_CELL_SIZE
+
+    def __init__(self, map_width, map_height):
+        self.map_width = map_width
+        self.map_height = map_height
+        self.fields = {}
+
+    @abstractmethod
+    def lookup(self, x, y):
+        # Id of the building containing each point, or -1
+        ...
+
+    @abstractmethod
+    def rects(self, ids):
+        # (left, top, right, bottom) arrays of the given buildings
+        ...
+
+    @abstractmethod
+    def type_of(self, ids):
+        # BUILDING_TYPES index of the given buildings
+        ...
+
+    @abstractmethod
+    def buildings_in(self, left, top, right, bottom):
+        # Building objects overlapping a world rect, for drawing
+        ...
+
+    @abstractmethod
+    def navigation_rects(self, type_):
+        # ((left, top, right, bottom) of the destinations of a type,
+        #  (left, top, right, bottom) of everything else in the way)
+        ...
+
+    def navigation(self, type_):
+        # Made on first use and kept for the life of the layout
+        if type_ not in self.fields:
+            self.fields[type_] = NavigationField(self, type_, self.nav_cell_size)
+        return self.fields[type_]
+
+    def push_out(self, x, y, ids):
+        # Move points inside a building just past its nearest edge, in place.
+        # Overlapping buildings can need a second pass.
+        for _ in range(3):
+            hit = np.flatnonzero(ids >= 0)
+            if len(hit) == 0:
+                return
+            left, top, right, bottom = self.rects(ids[hit])
+            hx = x[hit]
+            hy = y[hit]
+            depth = np.stack((hx - left, right - hx, hy - top, bottom - hy))
+            side = depth.argmin(axis=0)
+            x[hit] = np.where(side == 0, left - 1, np.where(side == 1, right + 1, hx))
+            y[hit] = np.where(side == 2, top - 1, np.where(side == 3, bottom + 1, hy))
+            ids[hit] = self.lookup(x[hit], y[hit])
+
+
+class BuildingIndex(CityIndex):
+    # Occupancy raster of the city: each cell holds the index of the
+    # building covering it, or -1. The cell size is the largest that lines
+    # up with every building edge, so a lookup is one array read per agent.
+    def __init__(self, buildings, map_width, map_height):
+        super().__init__(map_width, map_height)
+        self.buildings = list(buildings)
+        edges = [map_width, map_height]
+        for b in self.buildings:
+            edges += [b.x, b.y, b.width, b.height]
+        cell_size = 0
+        for edge in edges:
+            cell_size = math.gcd(cell_size, int(edge))
+        # Fall back to coarser, inexact cells for odd layouts; lookups
+        # always finish with an exact rect test
+        cell_size = max(cell_size, 1)
+        while (map_width // cell_size + 1) * (map_height // cell_size + 1) > MAX_INDEX_CELLS:
+            cell_size *= 2
+        self.cell_size = cell_size
+        self.cols = map_width // cell_size + 1
+        self.rows = map_height // cell_size + 1
+
+        self.left = np.array([b.left for b in self.buildings], dtype=np.float64)
+        self.top = np.array([b.top for b in self.buildings], dtype=np.float64)
+        self.right = np.array([b.right for b in self.buildings], dtype=np.float64)
+        self.bottom = np.array([b.bottom for b in self.buildings], dtype=np.float64)
+        self.types = np.array([BUILDING_TYPES.index(b.type) for b in self.buildings], dtype=np.int8)
+
+        self.cells = np.full((self.rows, self.cols), -1, dtype=np.int32)
+        for i, b in enumerate(self.buildings):
+            self.cells[b.top // cell_size:-(-b.bottom // cell_size),
+                       b.left // cell_size:-(-b.right // cell_size)] = i
+
+    def lookup(self, x, y):
+        cx = (x * (1 / self.cell_size)).astype(np.int32)
+        cy = (y * (1 / self.cell_size)).astype(np.int32)
+        np.clip(cx, 0, self.cols - 1, out=cx)
+        np.clip(cy, 0, self.rows - 1, out=cy)
+        cy *= self.cols
+        cy += cx
+        ids = self.cells.ravel()[cy]
+        hit = np.flatnonzero(ids >= 0)
+        if len(hit):
+            b = ids[hit]
+            inside = ((x[hit] >= self.left[b]) & (x[hit] < self.right[b]) &
+                      (y[hit] >= self.top[b]) & (y[hit] < self.bottom[b]))
+            ids[hit[~inside]] = -1
+        return ids
+
+    def rects(self, ids):
+        return self.left[ids], self.top[ids], self.right[ids], self.bottom[ids]
+
+    def type_of(self, ids):
+        return self.types[ids]
+
+    def buildings_in(self, left, top, right, bottom):
+        near = (self.right > left) & (self.left < right) & (self.bottom > top) & (self.top < bottom)
+        return [self.buildings[i] for i in np.flatnonzero(near)]
+
+    def navigation_rects(self, type_):
+        is_goal = self.types == BUILDING_TYPES.index(type_)
+        rects = np.stack((self.left, self.top, self.right, self.bottom))
+        return rects[:, is_goal], rects[:, ~is_goal]
+
+
+class ChunkedCity(CityIndex):
+    # Procedural city for maps too big to hold every building. The map is
+    # the same lattice of lots as create_city_layout, grouped into
+    # districts of different density, with hospitals and cemeteries spread
+    # among them. Which lots are built up is decided per chunk of lots,
+    # seeded by the chunk's position, so a chunk can be made on demand in
+    # any order. Only the chunks looked at recently are kept, in an LRU
+    # cache that grows past `max_chunks` only when a single lookup needs
+    # more chunks than that. A building's id is its lot number.
+    nav_cell_size = CHUNKED_NAV_CELL_SIZE
+
+    def __init__(self, map_width, map_height, seed, max_chunks=MAX_CACHED_CHUNKS):
+        super().__init__(map_width, map_height)
+        self.seed = seed
+        self.lots_x = len(range(STREET_WIDTH, map_width - STREET_WIDTH, BLOCK_SIZE))
+        self.lots_y = len(range(STREET_WIDTH, map_height - STREET_WIDTH, BLOCK_SIZE))
+        self.chunk_cols = -(-self.lots_x // LOTS_PER_CHUNK)
+        self.chunk_rows = -(-self.lots_y // LOTS_PER_CHUNK)
+
+        district_cols = -(-self.lots_x // DISTRICT_LOTS)
+        district_rows = -(-self.lots_y // DISTRICT_LOTS)
+        self.density = np.empty((district_rows, district_cols))
+        for dy in range(district_rows):
+            for dx in range(district_cols):
+                rng = np.random.default_rng([seed, DISTRICT_STREAM, dx, dy])
+                self.density[dy, dx] = DISTRICT_DENSITIES[rng.integers(len(DISTRICT_DENSITIES))]
+        self.destinations = self._place_destinations(district_cols, district_rows)
+
+        # Chunk tables live in fixed slots; chunk_slot maps a chunk to its
+        # slot or -1, and slot_used holds when each slot was last read
+        self.chunk_slot = np.full(self.chunk_cols * self.chunk_rows, -1, dtype=np.int64)
+        self.slot_chunk = np.full(max_chunks, -1, dtype=np.int64)
+        self.slot_lots = np.full((max_chunks, LOTS_PER_CHUNK, LOTS_PER_CHUNK), -1, dtype=np.int8)
+        self.slot_used = np.zeros(max_chunks, dtype=np.int64)
+        self.clock = 0
+
+    def _place_destinations(self, district_cols, district_rows):
+        # {(lot x, lot y): type code}. Each district may get a hospital and
+        # a cemetery on one of its lots; the district with the lowest draw
+        # always does, so the map has at least one of each.
+        destinations = {}
+        for code, chance in ((1, HOSPITAL_CHANCE), (2, CEMETERY_CHANCE)):
+            draws = {}
+            for dy in range(district_rows):
+                for dx in range(district_cols):
+                    rng = np.random.default_rng([self.seed, DESTINATION_STREAM, code, dx, dy])
+                    lx = dx * DISTRICT_LOTS + rng.integers(min(DISTRICT_LOTS, self.lots_x - dx * DISTRICT_LOTS))
+                    ly = dy * DISTRICT_LOTS + rng.integers(min(DISTRICT_LOTS, self.lots_y - dy * DISTRICT_LOTS))
+                    draws[(int(lx), int(ly))] = rng.random()
+            lowest = min(draws, key=draws.get)
+            for lot, draw in draws.items():
+                if (draw < chance or lot == lowest) and lot not in destinations:
+                    destinations[lot] = code
+        return destinations
+
+    def _make_chunk(self, key):
+        # Lot codes of one chunk: -1 empty, otherwise a BUILDING_TYPES index
+        cx = key % self.chunk_cols
+        cy = key // self.chunk_cols
+        rng = np.random.default_rng([self.seed, CHUNK_STREAM, cx, cy])
+        lx = cx * LOTS_PER_CHUNK + np.arange(LOTS_PER_CHUNK)
+        ly = cy * LOTS_PER_CHUNK + np.arange(LOTS_PER_CHUNK)
+        density = self.density[np.minimum(ly // DISTRICT_LOTS, len(self.density) - 1)[:, None],
+                               np.minimum(lx // DISTRICT_LOTS, self.density.shape[1] - 1)[None, :]]
+        built = rng.random((LOTS_PER_CHUNK, LOTS_PER_CHUNK)) < density
+        built &= (ly < self.lots_y)[:, None] & (lx < self.lots_x)[None, :]
+        lots = np.where(built, 0, -1).astype(np.int8)
+        for (x, y), code in self.destinations.items():
+            if lx[0] <= x <= lx[-1] and ly[0] <= y <= ly[-1]:
+                lots[y - ly[0], x - lx[0]] = code
+        return lots
+
+    def _load_chunk(self, key):
+        free = np.flatnonzero(self.slot_chunk < 0)
+        if len(free):
+            slot = free[0]
+        else:
+            # Evict the least recently read chunk. If every slot was read
+            # by the current lookup, the cache has to grow instead.
+            slot = int(self.slot_used.argmin())
+            if self.slot_used[slot] == self.clock:
+                slot = len(self.slot_chunk)
+                self.slot_chunk = np.concatenate((self.slot_chunk, np.full(slot, -1)))
+                self.slot_lots = np.concatenate((self.slot_lots, np.full_like(self.slot_lots, -1)))
+                self.slot_used = np.concatenate((self.slot_used, np.zeros(slot, dtype=np.int64)))
+            else:
+                self.chunk_slot[self.slot_chunk[slot]] = -1
+        self.slot_lots[slot] = self._make_chunk(key)
+        self.slot_chunk[slot] = key
+        self.chunk_slot[key] = slot
+        self.slot_used[slot] = self.clock
+
+    def lot_codes(self, lx, ly):
+        # Code of each lot, making any chunk that is not cached
+        keys = (ly // LOTS_PER_CHUNK) * self.chunk_cols + lx // LOTS_PER_CHUNK
+        slots = self.chunk_slot[keys]
+        self.clock += 1
+        self.slot_used[slots[slots >= 0]] = self.clock
+        missing = slots < 0
+        if missing.any():
+            for key in np.unique(keys[missing]):
+                self._load_chunk(key)
+            slots = self.chunk_slot[keys]
+        return self.slot_lots[slots, ly % LOTS_PER_CHUNK, lx % LOTS_PER_CHUNK]
+
+    def lookup(self, x, y):
+        # Only the top-left corner of a lot can be built on, so most points
+        # are ruled out before any chunk is read
+        lx = np.floor((x - STREET_WIDTH) * (1 / BLOCK_SIZE)).astype(np.int64)
+        ly = np.floor((y - STREET_WIDTH) * (1 / BLOCK_SIZE)).astype(np.int64)
+        ox = x - (STREET_WIDTH + lx * BLOCK_SIZE)
+        oy = y - (STREET_WIDTH + ly * BLOCK_SIZE)
+        ids = np.full(len(x), -1, dtype=np.int64)
+        hit = np.flatnonzero((lx >= 0) & (lx < self.lots_x) & (ly >= 0) & (ly < self.lots_y) &
+                             (ox < DESTINATION_SIZE) & (oy < DESTINATION_SIZE))
+        if len(hit):
+            size = LOT_SIZES[self.lot_codes(lx[hit], ly[hit]) + 1]
+            hit = hit[(ox[hit] < size) & (oy[hit] < size)]
+            ids[hit] = ly[hit] * self.lots_x + lx[hit]
+        return ids
+
+    def rects(self, ids):
+        lx = ids % self.lots_x
+        ly = ids // self.lots_x
+        left = STREET_WIDTH + lx * BLOCK_SIZE
+        top = STREET_WIDTH + ly * BLOCK_SIZE
+        size = LOT_SIZES[self.lot_codes(lx, ly) + 1]
+        return left.astype(np.float64), top.astype(np.float64), left + size, top + size
+
+    def type_of(self, ids):
+        return self.lot_codes(ids % self.lots_x, ids // self.lots_x)
+
+    def buildings_in(self, left, top, right, bottom):
+        x0 = max(0, int((left - STREET_WIDTH - DESTINATION_SIZE) // BLOCK_SIZE) + 1)
+        y0 = max(0, int((top - STREET_WIDTH - DESTINATION_SIZE) // BLOCK_SIZE) + 1)
+        x1 = min(self.lots_x - 1, int((right - STREET_WIDTH) // BLOCK_SIZE))
+        y1 = min(self.lots_y - 1, int((bottom - STREET_WIDTH) // BLOCK_SIZE))
+        if x1 < x0 or y1 < y0:
+            return []
+        ly, lx = np.mgrid[y0:y1 + 1, x0:x1 + 1]
+        lx = lx.ravel()
+        ly = ly.ravel()
+        codes = self.lot_codes(lx, ly)
+        buildings = []
+        for x, y, code in zip(lx.tolist(), ly.tolist(), codes.tolist()):
+            if code >= 0:
+                size = int(LOT_SIZES[code + 1])
+                buildings.append(Building(STREET_WIDTH + x * BLOCK_SIZE, STREET_WIDTH + y * BLOCK_SIZE,
+                                          size, size, BUILDING_TYPES[code]))
+        return buildings
+
+    def navigation_rects(self, type_):
+        # Plans routes without making a single chunk: every lot counts as
+        # built up, except that destinations are exactly where they are
+        code = BUILDING_TYPES.index(type_)
+        ly, lx = np.mgrid[0:self.lots_y, 0:self.lots_x]
+        lx = lx.ravel()
+        ly = ly.ravel()
+        size = np.full(len(lx), BUILDING_SIZE, dtype=np.float64)
+        is_goal = np.zeros(len(lx), dtype=bool)
+        for (x, y), lot_code in self.destinations.items():
+            size[y * self.lots_x + x] = DESTINATION_SIZE
+            is_goal[y * self.lots_x + x] = lot_code == code
+        left = STREET_WIDTH + lx * BLOCK_SIZE
+        top = STREET_WIDTH + ly * BLOCK_SIZE
+        rects = np.stack((left, top, left + size, top + size)).astype(np.float64)
+        return rects[:, is_goal], rects[:, ~is_goal]
+
+
+class NavigationField:
+    # Walking distance to the nearest building of one type, over a coarse
+    # raster of the streets, with the direction to step in from each cell.
+    # Built once per layout by a breadth-first search outward from every
+    # destination at once, so routing any number of people afterwards is
+    # one array read each and costs the same as wandering.
+    def __init__(self, city, type_, cell_size=NAV_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cols = -(-city.map_width // cell_size)
+        self.rows = -(-city.map_height // cell_size)
+        # One blocked cell of padding all round, so neighbour offsets in
+        # the flat arrays never wrap onto the next row
+        width = self.cols + 2
+        height = self.rows + 2
+        self.width = width
+
+        # Cells touched by a destination are goals, labelled with its
+        # number; cells touched by any other building are walls, even where
+        # that building overlaps a destination
+        goals, walls = city.navigation_rects(type_)
+        left, top, right, bottom = goals
+        # Same rounding as Building.centerx/centery
+        self.goal_x = left + (right - left) // 2
+        self.goal_y = top + (bottom - top) // 2
+        walkable = np.zeros((height, width), dtype=bool)
+        walkable[1:-1, 1:-1] = True
+        goal = np.full((height, width), -1, dtype=np.int32)
+        for i, (l, t, r, b) in enumerate(zip(*goals)):
+            goal[self._span(t, b), self._span(l, r)] = i
+        for l, t, r, b in zip(*walls):
+            rows, cols = self._span(t, b), self._span(l, r)
+            walkable[rows, cols] = False
+            goal[rows, cols] = -1
+        walkable = walkable.ravel()
+        goal = goal.ravel()
+
+        distance = np.full(width * height, -1, dtype=np.int32)
+        frontier = np.flatnonzero(goal >= 0)
+        distance[frontier] = 0
+        steps = np.array([1, -1, width, -width])
+        step = 0
+        while len(frontier):
+            step += 1
+            cells = (frontier[:, None] + steps).ravel()
+            sources = np.repeat(frontier, len(steps))
+            new = walkable[cells] & (distance[cells] < 0)
+            cells, first = np.unique(cells[new], return_index=True)
+            distance[cells] = step
+            goal[cells] = goal[sources[new][first]]
+            frontier = cells
+        self.distance = distance
+        self.goal = goal
+        self.flow_x, self.flow_y = self._flow(distance.reshape(height, width))
+
+    def _span(self, start, end):
+        # Padded raster rows or columns overlapping [start, end)
+        return slice(int(start // self.cell_size) + 1, int(-(-end // self.cell_size)) + 1)
+
+    def _flow(self, distance):
+        # Unit step towards the neighbour closest to a goal. Diagonal
+        # steps are only taken between two open cells, so nobody cuts a
+        # building corner.
+        height, width = distance.shape
+        open_ = distance >= 0
+        best = np.where(open_, distance, np.iinfo(np.int32).max)
+        flow_x = np.zeros((height, width), dtype=np.float32)
+        flow_y = np.zeros((height, width), dtype=np.float32)
+        inner = (slice(1, -1), slice(1, -1))
+        for dx, dy in NAV_STEPS:
+            neighbour = (slice(1 + dy, height - 1 + dy), slice(1 + dx, width - 1 + dx))
+            better = open_[neighbour] & (distance[neighbour] < best[inner])
+            if dx and dy:
+                better &= (open_[1:-1, 1 + dx:width - 1 + dx] & open_[1 + dy:height - 1 + dy, 1:-1])
+            best[inner] = np.where(better, distance[neighbour], best[inner])
+            length = np.hypot(dx, dy)
+            flow_x[inner] = np.where(better, dx / length, flow_x[inner])
+            flow_y[inner] = np.where(better, dy / length, flow_y[inner])
+        # Goals and walls have no direction: people there head straight
+        # for the target
+        stay = distance <= 0
+        flow_x[stay] = 0
+        flow_y[stay] = 0
+        return flow_x.ravel(), flow_y.ravel()
+
+    @property
+    def reachable(self):
+        return bool((self.goal >= 0).any())
+
+    def cells_of(self, x, y):
+        cx = (x * (1 / self.cell_size)).astype(np.int32)
+        cy = (y * (1 / self.cell_size)).astype(np.int32)
+        np.clip(cx, 0, self.cols - 1, out=cx)
+        np.clip(cy, 0, self.rows - 1, out=cy)
+        return (cy + 1) * self.width + cx + 1
+
+
+def create_city(map_width, map_height, rng):
+    # The city for a map: one flat layout up to the Large size, a chunked
+    # procedural one beyond that, seeded from `rng` either way
+    if map_width * map_height <= MAX_FLAT_AREA:
+        return BuildingIndex(create_city_layout(map_width, map_height, rng), map_width, map_height)
+    return ChunkedCity(map_width, map_height, int(rng.integers(2**63)))
+
+
+def create_city_layout(map_width, map_height, rng):
+    buildings = []
+
+    # Blocks on a regular lattice between the streets
+    for x in range(STREET_WIDTH, map_width - STREET_WIDTH, BLOCK_SIZE):
+        for y in range(STREET_WIDTH, map_height - STREET_WIDTH, BLOCK_SIZE):
+            if rng.random() < BUILDING_CHANCE:
+                buildings.append(Building(x, y, BUILDING_SIZE, BUILDING_SIZE, 'building'))
+
+    # Create hospital
+    buildings.append(Building(map_width - 200, 100, 150, 150, 'hospital'))
+
+    # Create cemetery
+    buildings.append(Building(100, map_height - 200, 150, 150, 'cemetery'))
+    return buildings